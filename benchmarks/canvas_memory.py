@@ -0,0 +1,70 @@
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gtkinter import _ItemStore, _SpatialGrid, _RECTANGLE, _pack_color
+
+COUNT = 100000
+
+
+def make_items():
+    rng = random.Random(0)
+    for _ in range(COUNT):
+        x = rng.uniform(0, 4000)
+        y = rng.uniform(0, 4000)
+        yield x, y, x + rng.uniform(2, 20), y + rng.uniform(2, 20), (rng.random(), rng.random(), rng.random())
+
+
+def measure(build):
+    items = list(make_items())
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build(items)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def build_dicts(items):
+    store = []
+    for x1, y1, x2, y2, fill in items:
+        store.append({
+            'type': 'rectangle',
+            'x': x1, 'y': y1,
+            'width': x2 - x1, 'height': y2 - y1,
+            'fill': tuple(fill),
+            'outline': None
+        })
+    return store
+
+
+def build_columns(items):
+    store = _ItemStore()
+    grid = _SpatialGrid()
+    for x1, y1, x2, y2, fill in items:
+        bbox = (x1 - 1, y1 - 1, x2 + 1, y2 + 1)
+        item_id = store.add(_RECTANGLE, (x1, y1, x2, y2), bbox, _pack_color(fill), None, None, 0, None)
+        grid.insert(item_id, bbox)
+    return store, grid
+
+
+def build_columns_without_index(items):
+    store = _ItemStore()
+    for x1, y1, x2, y2, fill in items:
+        store.add(_RECTANGLE, (x1, y1, x2, y2), (x1 - 1, y1 - 1, x2 + 1, y2 + 1),
+                  _pack_color(fill), None, None, 0, None)
+    return store
+
+
+if __name__ == '__main__':
+    dicts = measure(build_dicts)
+    columns = measure(build_columns_without_index)
+    indexed = measure(build_columns)
+    print(f"{COUNT} rectangles")
+    print(f"  list of dicts:          {dicts / 1e6:8.2f} MB  ({dicts / COUNT:6.1f} B/item)")
+    print(f"  columnar store:         {columns / 1e6:8.2f} MB  ({columns / COUNT:6.1f} B/item)")
+    print(f"  columnar store + index: {indexed / 1e6:8.2f} MB  ({indexed / COUNT:6.1f} B/item)")
@@ -3,10 +3,29 @@ import gi
 gi.require_version('Gtk', '3.0')
 gi.require_version('Gdk', '3.0')
 gi.require_version('Pango', '1.0')
-from gi.repository import Gtk, Gdk, GdkPixbuf, Pango, GLib
+gi.require_version('PangoCairo', '1.0')
+from gi.repository import Gtk, Gdk, GdkPixbuf, GObject, Pango, PangoCairo, GLib
+import asyncio
+import cairo
+import codecs
+import heapq
+import logging
+import math
+import mmap
 import os
+import re
 import sys
-from functools import partial
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from queue import Empty, SimpleQueue
+from functools import lru_cache, partial
+from itertools import islice
+from operator import add
 
 
 class Tk:
@@ -313,6 +332,7 @@ class Tk:
 
 class Widget:
     _root = None
+    _create_options = ()
 
     def __init__(self, master=None, **kwargs):
         if master is None:
@@ -321,7 +341,12 @@ class Widget:
             master = Widget._root
 
         self.master = master
+        self._frame_callbacks = {}
+        self._next_frame_id = 1
+        self._tick_id = None
+        self._traces = []
         self._widget = self._create_widget(**kwargs)
+        self._widget.connect("destroy", self._untrace)
         self._images = {}
         self._configure(**kwargs)
 
@@ -344,6 +369,14 @@ class Widget:
     def _create_widget(self, **kwargs):
         raise NotImplementedError
 
+    def _trace_variable(self, var, callback):
+        self._traces.append((var, var.trace_add('write', callback)))
+
+    def _untrace(self, *args):
+        for var, cbname in self._traces:
+            var.trace_remove('write', cbname)
+        self._traces = []
+
     def _parse_font(self, font_spec):
         font_desc = Pango.FontDescription()
 
@@ -400,7 +433,9 @@ class Widget:
 
     def _configure(self, **kwargs):
         for key, value in kwargs.items():
-            if key == 'textvariable':
+            if key in self._create_options:
+                continue
+            elif key == 'textvariable':
                 self._set_textvariable(value)
             elif key == 'var':
                 self._set_variable(value)
@@ -491,6 +526,32 @@ class Widget:
     def unbind(self, sequence, funcid=None):
         pass
 
+    def on_frame(self, callback):
+        frame_id = self._next_frame_id
+        self._next_frame_id += 1
+        self._frame_callbacks[frame_id] = callback
+        if self._tick_id is None:
+            self._tick_id = self._widget.add_tick_callback(self._on_tick)
+        return frame_id
+
+    def cancel_frame(self, frame_id):
+        self._frame_callbacks.pop(frame_id, None)
+
+    def _on_tick(self, widget, frame_clock):
+        frame_time = frame_clock.get_frame_time() / 1e6
+        for frame_id, callback in list(self._frame_callbacks.items()):
+            try:
+                keep = callback(frame_time) is not False
+            except Exception:
+                keep = False
+                sys.excepthook(*sys.exc_info())
+            if not keep:
+                self._frame_callbacks.pop(frame_id, None)
+        if self._frame_callbacks:
+            return GLib.SOURCE_CONTINUE
+        self._tick_id = None
+        return GLib.SOURCE_REMOVE
+
     def _set_anchor(self, anchor):
         anchor_map = {
             'n': (Gtk.Align.CENTER, Gtk.Align.START),
@@ -681,9 +742,14 @@ class Label(Widget):
         self._label_widget.set_label(text)
 
     def _set_textvariable(self, var):
-        var.trace('w', lambda *_: self._label_widget.set_label(var.get()))
+        self._untrace()
+        self._textvariable = var
+        self._trace_variable(var, self._update_label)
         self._label_widget.set_label(var.get())
 
+    def _update_label(self, *args):
+        self._label_widget.set_label(self._textvariable.get())
+
     def _set_compound(self, compound):
         if compound == 'left':
             self._label_widget.set_xalign(0.0)
@@ -729,15 +795,25 @@ class Label(Widget):
 
 
 class Entry(Widget):
+    _create_options = ('textvariable',)
+
     def _create_widget(self, **kwargs):
         entry = Gtk.Entry()
+        self._completion = None
+        self._completion_limit = 50
+        self._entry_completion = None
+        self._suggestions = None
+        self._fuzzy = False
+        self._fuzzy_jobs = None
+        self._fuzzy_generation = 0
         if 'show' in kwargs:
             entry.set_visibility(kwargs['show'] != '*')
         if 'textvariable' in kwargs:
             self._textvariable = kwargs['textvariable']
             entry.set_text(self._textvariable.get())
-            self._textvariable.trace("w", self._update_text)
+            self._trace_variable(self._textvariable, self._update_text)
             entry.connect("changed", self._update_var)
+        entry.connect("destroy", lambda widget: self._stop_fuzzy())
         return entry
 
     def _set_text(self, text):
@@ -756,10 +832,228 @@ class Entry(Widget):
         self._widget.set_text(self._textvariable.get())
 
     def _update_var(self, widget):
-        self._textvariable.set(widget.get_text())
+        self._textvariable._set(widget.get_text(), self._update_text)
+
+    def _set_completion(self, words):
+        self._fuzzy_generation += 1
+        if words is None:
+            self._completion = None
+            if self._entry_completion is not None:
+                self._suggestions.clear()
+            return
+        self._completion = _ValueIndex(words)
+        self._completion._order()
+        if self._entry_completion is None:
+            self._suggestions = Gtk.ListStore(str)
+            completion = Gtk.EntryCompletion()
+            completion.set_model(self._suggestions)
+            completion.set_text_column(0)
+            completion.set_match_func(lambda *args: True)
+            self._entry_completion = completion
+            self._widget.set_completion(completion)
+            self._widget.connect("changed", self._on_completion_changed)
+
+    def _set_completion_limit(self, limit):
+        self._completion_limit = limit
+
+    def _set_fuzzy(self, fuzzy):
+        self._fuzzy = fuzzy
+        if not fuzzy:
+            self._stop_fuzzy()
+
+    def _stop_fuzzy(self):
+        self._fuzzy_generation += 1
+        if self._fuzzy_jobs is not None:
+            self._fuzzy_jobs.put(None)
+            self._fuzzy_jobs = None
+
+    def suggest(self, prefix, limit=None):
+        if self._completion is None or not prefix:
+            return []
+        return self._completion.prefix(prefix, limit or self._completion_limit)
+
+    def _on_completion_changed(self, widget):
+        if self._completion is None:
+            return
+        text = widget.get_text()
+        matches = self.suggest(text)
+        self._show_suggestions(matches)
+        self._fuzzy_generation += 1
+        if self._fuzzy and text and len(matches) < self._completion_limit:
+            if self._fuzzy_jobs is None:
+                self._fuzzy_jobs = SimpleQueue()
+                threading.Thread(target=self._fuzzy_worker, args=(self._fuzzy_jobs,), daemon=True).start()
+            self._fuzzy_jobs.put((self._fuzzy_generation, text, matches, self._completion, self._completion_limit))
+
+    def _show_suggestions(self, matches):
+        store = self._suggestions
+        self._entry_completion.set_model(None)
+        store.clear()
+        for match in matches:
+            store.insert_with_valuesv(-1, [0], [match])
+        self._entry_completion.set_model(store)
+        if matches:
+            self._entry_completion.complete()
+
+    def _fuzzy_worker(self, jobs):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            generation, text, matches, index, limit = job
+            if generation != self._fuzzy_generation:
+                continue
+            found = index.fuzzy(text, limit, lambda: generation != self._fuzzy_generation)
+            if found is not None:
+                GLib.idle_add(self._finish_fuzzy, generation, matches, found, limit)
+
+    def _finish_fuzzy(self, generation, matches, found, limit):
+        if generation == self._fuzzy_generation:
+            seen = set(matches)
+            self._show_suggestions(matches + [match for match in found if match not in seen][:limit - len(matches)])
+        return False
+
+
+_UNLEXED = object()
+_TEXT_INDEX_BASE = re.compile(r'\s*(?:(\d+)\.(\d+|end)|(\d+)(?![\w.])|([^\s+-]+))')
+_TEXT_INDEX_MODIFIER = re.compile(r'\s*(?:([+-])\s*(\d+)\s*(chars?|c|lines?|l)(?![a-z])|(linestart|lineend|wordstart|wordend))')
+
+
+@lru_cache(maxsize=1024)
+def _parse_text_index(index):
+    match = _TEXT_INDEX_BASE.match(index)
+    if match is None:
+        raise ValueError(f"Bad text index '{index}'")
+    line, char, row, name = match.groups()
+    if line is not None:
+        base = (int(line) - 1, None if char == 'end' else int(char))
+    elif row is not None:
+        base = (int(row), 0)
+    else:
+        base = name
+    modifiers = []
+    position = match.end()
+    while index[position:].strip():
+        match = _TEXT_INDEX_MODIFIER.match(index, position)
+        if match is None:
+            raise ValueError(f"Bad text index '{index}'")
+        sign, count, unit, word = match.groups()
+        if word is not None:
+            modifiers.append((word, 0))
+        else:
+            modifiers.append(('chars' if unit[0] == 'c' else 'lines', int(count) if sign == '+' else -int(count)))
+        position = match.end()
+    return base, tuple(modifiers)
+
+
+def _text_index(iter):
+    return f"{iter.get_line() + 1}.{iter.get_line_offset()}"
+
+
+class _TextSearch:
+    _batch = 256
+    _interval = 0.05
+
+    def __init__(self, text, regex, first, last, replacement=None, tag=None, on_match=None, on_done=None):
+        self.matches = []
+        self.done = False
+        self.cancelled = False
+        self._text = text
+        self._replacement = replacement
+        self._edits = []
+        self._tag = text._tag(tag) if tag else None
+        self._on_match = on_match
+        self._on_done = on_done
+        buffer = text._buffer
+        snapshot = buffer.get_text(first, last, True)
+        self._handler = buffer.connect("changed", self._on_changed)
+        threading.Thread(target=self._scan, daemon=True,
+                         args=(regex, snapshot, first.get_offset(), first.get_line() + 1, first.get_line_offset())).start()
+
+    def cancel(self):
+        if not self.cancelled and not self.done:
+            self.cancelled = True
+            self._text._buffer.disconnect(self._handler)
+
+    def _on_changed(self, buffer):
+        self.cancel()
+
+    def _scan(self, regex, snapshot, offset, line, char):
+        counted = 0
+        line_start = -char
+
+        def position(pos):
+            nonlocal counted, line, line_start
+            newlines = snapshot.count('\n', counted, pos)
+            if newlines:
+                line += newlines
+                line_start = snapshot.rfind('\n', counted, pos) + 1
+            counted = pos
+            return f"{line}.{pos - line_start}"
+
+        replacement = self._replacement
+        batch = []
+        deadline = time.perf_counter() + self._interval
+        for match in regex.finditer(snapshot):
+            if self.cancelled:
+                return
+            start, end = match.span()
+            if start == end:
+                continue
+            batch.append((offset + start, offset + end, position(start), position(end),
+                          None if replacement is None else match.expand(replacement)))
+            if len(batch) >= self._batch or time.perf_counter() >= deadline:
+                GLib.idle_add(self._deliver, batch)
+                batch = []
+                deadline = time.perf_counter() + self._interval
+        GLib.idle_add(self._deliver, batch, True)
+
+    def _deliver(self, batch, finished=False):
+        if self.cancelled:
+            return False
+        buffer = self._text._buffer
+        if self._tag is not None:
+            for start, end, _, _, _ in batch:
+                buffer.apply_tag(self._tag, buffer.get_iter_at_offset(start), buffer.get_iter_at_offset(end))
+        ranges = [(first, last) for _, _, first, last, _ in batch]
+        self.matches.extend(ranges)
+        if self._replacement is not None:
+            self._edits.extend(batch)
+        if ranges and self._on_match is not None:
+            self._on_match(ranges)
+        if finished:
+            self.done = True
+            buffer.disconnect(self._handler)
+            if self._edits:
+                with self._text.batch():
+                    for start, end, _, _, replacement in reversed(self._edits):
+                        iter = buffer.get_iter_at_offset(start)
+                        buffer.delete(iter, buffer.get_iter_at_offset(end))
+                        if replacement:
+                            buffer.insert(iter, replacement)
+                self._edits = []
+            if self._on_done is not None:
+                self._on_done(self.matches)
+        return False
 
 
 class Text(Widget):
+    _highlight_budget = 0.004
+    _tag_properties = {
+        'foreground': 'foreground',
+        'fg': 'foreground',
+        'background': 'background',
+        'bg': 'background',
+        'justify': 'justification',
+        'lmargin1': 'left-margin',
+        'rmargin': 'right-margin',
+        'spacing1': 'pixels-above-lines',
+        'spacing2': 'pixels-inside-wrap',
+        'spacing3': 'pixels-below-lines',
+        'elide': 'invisible',
+        'overstrike': 'strikethrough',
+    }
+
     def _create_widget(self, **kwargs):
         self._textview = Gtk.TextView()
         self._buffer = self._textview.get_buffer()
@@ -775,30 +1069,521 @@ class Text(Widget):
             }.get(kwargs['wrap'], Gtk.WrapMode.WORD)
             self._textview.set_wrap_mode(wrap_mode)
 
+        self._maxlines = None
+        self._follow = False
+        self._pending = deque()
+        self._pending_lines = 0
+        self._pending_reset = False
+        self._pending_lock = threading.Lock()
+        self._flush_frame = None
+        self._flush_requested = False
+        self._end_mark = self._buffer.create_mark(None, self._buffer.get_end_iter(), False)
+        self._lexer = None
+        self._lexer_handlers = ()
+        self._line_states = []
+        self._lexed_tags = set()
+        self._dirty = None
+        self._highlight_source = None
+        self._marks = {}
+        self._batch_depth = 0
+        self._batch_changed = False
+        self._modified_handler = None
+        self._modified_callbacks = []
+        self._changed_handler = None
+        self._changed_callbacks = []
         return self._widget
 
+    def _set_maxlines(self, maxlines):
+        self._maxlines = maxlines
+        self._flush()
+
+    def _set_follow(self, follow):
+        self._follow = follow
+
+    def _line_iter(self, line, char):
+        buffer = self._buffer
+        if line >= buffer.get_line_count():
+            return buffer.get_end_iter()
+        iter = buffer.get_iter_at_line(max(line, 0))
+        if char != 0:
+            end = iter.copy()
+            if not end.ends_line():
+                end.forward_to_line_end()
+            if char is None or char >= end.get_line_offset():
+                return end
+            iter.set_line_offset(char)
+        return iter
+
+    def _mark(self, name):
+        mark = self._marks.get(name)
+        if mark is None:
+            mark = self._buffer.get_mark(name)
+            if mark is None:
+                raise ValueError(f"Unknown mark '{name}'")
+            self._marks[name] = mark
+        return mark
+
+    def _iter(self, index):
+        buffer = self._buffer
+        if isinstance(index, int):
+            return buffer.get_iter_at_line(index)
+        if not isinstance(index, str):
+            index = str(index)
+        base, modifiers = _parse_text_index(index)
+        if isinstance(base, tuple):
+            iter = self._line_iter(*base)
+        elif base == 'end':
+            iter = buffer.get_end_iter()
+            if modifiers and modifiers[0][0] == 'chars' and modifiers[0][1] < 0:
+                modifiers = (('chars', modifiers[0][1] + 1),) + modifiers[1:]
+        elif base in ('sel.first', 'sel.last'):
+            bounds = buffer.get_selection_bounds()
+            if not bounds:
+                raise ValueError("Text has no selection")
+            iter = bounds[base == 'sel.last']
+        else:
+            iter = buffer.get_iter_at_mark(self._mark(base))
+        for modifier, count in modifiers:
+            if modifier == 'chars':
+                if count > 0:
+                    iter.forward_chars(count)
+                elif count < 0:
+                    iter.backward_chars(-count)
+            elif modifier == 'lines':
+                iter = self._line_iter(iter.get_line() + count, iter.get_line_offset())
+            elif modifier == 'linestart':
+                iter.set_line_offset(0)
+            elif modifier == 'lineend':
+                if not iter.ends_line():
+                    iter.forward_to_line_end()
+            elif modifier == 'wordstart':
+                if iter.inside_word() and not iter.starts_word():
+                    iter.backward_word_start()
+            elif iter.inside_word():
+                iter.forward_word_end()
+        return iter
+
+    def index(self, index):
+        self._flush()
+        return _text_index(self._iter(index))
+
+    def search(self, pattern, index='1.0', stopindex='end', regex=False, nocase=False, all=False,
+               tag=None, on_match=None, on_done=None):
+        self._flush()
+        first, last = self._iter(index), self._iter(stopindex)
+        if not regex and not all:
+            flags = Gtk.TextSearchFlags.TEXT_ONLY
+            if nocase:
+                flags |= Gtk.TextSearchFlags.CASE_INSENSITIVE
+            found = first.forward_search(pattern, flags, last)
+            return (_text_index(found[0]), _text_index(found[1])) if found else None
+        compiled = re.compile(pattern if regex else re.escape(pattern), re.MULTILINE | (re.IGNORECASE if nocase else 0))
+        if all:
+            return _TextSearch(self, compiled, first, last, None, tag, on_match, on_done)
+        match = compiled.search(self._buffer.get_text(first, last, True))
+        if match is None:
+            return None
+        start, end = first.copy(), first.copy()
+        start.forward_chars(match.start())
+        end.forward_chars(match.end())
+        return _text_index(start), _text_index(end)
+
+    def replace_all(self, pattern, replacement, index='1.0', stopindex='end', regex=False, nocase=False,
+                    on_done=None):
+        self._flush()
+        if not regex:
+            pattern = re.escape(pattern)
+            replacement = replacement.replace('\\', '\\\\')
+        compiled = re.compile(pattern, re.MULTILINE | (re.IGNORECASE if nocase else 0))
+        return _TextSearch(self, compiled, self._iter(index), self._iter(stopindex), replacement, on_done=on_done)
+
+    def mark_set(self, name, index):
+        self._flush()
+        buffer = self._buffer
+        iter = self._iter(index)
+        if name == 'insert':
+            buffer.place_cursor(iter)
+            return
+        mark = self._marks.get(name) or buffer.get_mark(name)
+        if mark is None:
+            mark = buffer.create_mark(name, iter, False)
+        else:
+            buffer.move_mark(mark, iter)
+        self._marks[name] = mark
+
+    def mark_unset(self, *names):
+        buffer = self._buffer
+        for name in names:
+            if name in ('insert', 'selection_bound'):
+                continue
+            mark = self._marks.pop(name, None) or buffer.get_mark(name)
+            if mark is not None:
+                buffer.delete_mark(mark)
+
+    def mark_names(self):
+        return ('insert',) + tuple(name for name in self._marks if name not in ('insert', 'selection_bound'))
+
+    def mark_gravity(self, name, direction=None):
+        mark = self._mark(name)
+        if direction is None:
+            return 'left' if mark.get_left_gravity() else 'right'
+        if (direction == 'left') != mark.get_left_gravity():
+            buffer = self._buffer
+            iter = buffer.get_iter_at_mark(mark)
+            buffer.delete_mark(mark)
+            self._marks[name] = buffer.create_mark(name, iter, direction == 'left')
+
+    def see(self, index):
+        self._flush()
+        self._textview.scroll_to_iter(self._iter(index), 0.0, False, 0.0, 0.0)
+
+    def begin_user_action(self):
+        self._batch_depth += 1
+        self._buffer.begin_user_action()
+
+    def end_user_action(self):
+        self._buffer.end_user_action()
+        self._batch_depth -= 1
+        if not self._batch_depth and self._batch_changed:
+            self._batch_changed = False
+            self._notify(self._changed_callbacks)
+
+    @contextmanager
+    def batch(self):
+        self.begin_user_action()
+        try:
+            yield self
+        finally:
+            self.end_user_action()
+
+    def bind(self, sequence, func, add=None):
+        if sequence == "<<Modified>>":
+            if self._modified_handler is None:
+                self._modified_handler = self._buffer.connect(
+                    "modified-changed", lambda buffer: self._notify(self._modified_callbacks))
+            callbacks = self._modified_callbacks
+        elif sequence == "<<Changed>>":
+            if self._changed_handler is None:
+                self._changed_handler = self._buffer.connect("changed", self._on_buffer_changed)
+            callbacks = self._changed_callbacks
+        else:
+            return super().bind(sequence, func, add)
+        if not add:
+            callbacks.clear()
+        callbacks.append(func)
+
+    def _on_buffer_changed(self, buffer):
+        if self._batch_depth:
+            self._batch_changed = True
+        else:
+            self._notify(self._changed_callbacks)
+
+    def _notify(self, callbacks):
+        for callback in list(callbacks):
+            callback(None)
+
+    def edit_modified(self, flag=None):
+        if flag is None:
+            return self._buffer.get_modified()
+        self._buffer.set_modified(bool(flag))
+
     def insert(self, index, text, tags=None):
-        if isinstance(index, str) and index == 'end':
-            iter = self._buffer.get_end_iter()
+        if index == 'end' and tags is None and (self._maxlines or self._follow):
+            self._queue(text)
+            self._request_flush()
+            return
+        self._flush()
+        iter = self._iter(index)
+        if tags:
+            if isinstance(tags, str):
+                tags = (tags,)
+            self._buffer.insert_with_tags(iter, text, *[self._tag(name) for name in tags])
         else:
-            iter = self._buffer.get_iter_at_line(index)
-        self._buffer.insert(iter, text)
+            self._buffer.insert(iter, text)
+
+    def write(self, text):
+        self._queue(text)
+        if not self._flush_requested:
+            self._flush_requested = True
+            GLib.idle_add(self._request_flush)
+
+    def _queue(self, text):
+        with self._pending_lock:
+            self._pending.append(text)
+            if self._maxlines:
+                self._pending_lines += text.count('\n')
+                if self._pending_lines > 2 * self._maxlines:
+                    text = self._take_pending()
+                    self._pending.append(text)
+                    self._pending_lines = text.count('\n')
+
+    def _take_pending(self):
+        pending = self._pending
+        text = ''.join(pending)
+        pending.clear()
+        self._pending_lines = 0
+        if self._maxlines:
+            splits = self._maxlines + text.endswith('\n')
+            lines = text.rsplit('\n', splits)
+            if len(lines) > splits:
+                self._pending_reset = True
+                text = '\n'.join(lines[1:])
+        return text
+
+    def _request_flush(self):
+        if self._flush_frame is None:
+            self._flush_frame = self.on_frame(self._on_flush_frame)
+        return False
+
+    def _on_flush_frame(self, frame_time):
+        self._flush_frame = None
+        self._flush()
+        return False
+
+    def _flush(self):
+        self._flush_requested = False
+        with self._pending_lock:
+            if not self._pending:
+                return
+            text = self._take_pending()
+            reset, self._pending_reset = self._pending_reset, False
+        buffer = self._buffer
+        if reset:
+            buffer.delete(buffer.get_start_iter(), buffer.get_end_iter())
+        buffer.insert(buffer.get_end_iter(), text)
+        if self._maxlines:
+            lines = buffer.get_line_count()
+            if lines > 1 and buffer.get_end_iter().starts_line():
+                lines -= 1
+            if lines > self._maxlines:
+                buffer.delete(buffer.get_start_iter(), buffer.get_iter_at_line(lines - self._maxlines))
+        if self._follow:
+            buffer.move_mark(self._end_mark, buffer.get_end_iter())
+            self._textview.scroll_to_mark(self._end_mark, 0.0, False, 0.0, 0.0)
+
+    def load_file(self, path, encoding='utf-8', chunk=1 << 20, budget_ms=8, on_progress=None, on_done=None,
+                  on_error=None):
+        self._flush()
+        buffer = self._buffer
+        buffer.set_text('')
+        mark = buffer.create_mark(None, buffer.get_end_iter(), False)
+        size = os.path.getsize(path)
+
+        def pieces():
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            with open(path, 'rb') as f:
+                if not size:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    for offset in range(0, size, chunk):
+                        yield decoder.decode(view[offset:offset + chunk], offset + chunk >= size)
+
+        def append(texts):
+            buffer.insert(buffer.get_iter_at_mark(mark), ''.join(texts))
+
+        def progress(count):
+            if on_progress is not None:
+                on_progress(min(count * chunk, size), size)
+
+        def done(count):
+            buffer.delete_mark(mark)
+            if on_done is not None:
+                on_done(size)
+
+        def failed(error):
+            buffer.delete_mark(mark)
+            if on_error is None:
+                raise error
+            on_error(error)
+
+        return _RowStream(append, pieces(), 1, budget_ms, progress, done, failed)
+
+    def save_file(self, path, encoding='utf-8', chunk=1 << 20):
+        self._flush()
+        buffer = self._buffer
+        temporary = f"{path}.tmp"
+        with open(temporary, 'wb') as f:
+            start = buffer.get_start_iter()
+            while not start.is_end():
+                end = start.copy()
+                end.forward_chars(chunk)
+                f.write(buffer.get_text(start, end, True).encode(encoding))
+                start = end
+        os.replace(temporary, path)
 
     def get(self, first, last=None):
-        start = self._buffer.get_iter_at_line(first)
-        end = self._buffer.get_iter_at_line(last) if last else self._buffer.get_end_iter()
+        self._flush()
+        start = self._iter(first)
+        end = self._iter(last) if last else self._buffer.get_end_iter()
         return self._buffer.get_text(start, end, True)
 
     def delete(self, first, last=None):
-        start = self._buffer.get_iter_at_line(first)
-        end = self._buffer.get_iter_at_line(last) if last else self._buffer.get_end_iter()
+        self._flush()
+        start = self._iter(first)
+        end = self._iter(last) if last else self._buffer.get_end_iter()
         self._buffer.delete(start, end)
 
+    def _tag(self, tag_name):
+        tag = self._buffer.get_tag_table().lookup(tag_name)
+        if tag is None:
+            tag = self._buffer.create_tag(tag_name)
+        return tag
+
+    def _range(self, first, last):
+        self._flush()
+        start = self._iter(first)
+        if last is None:
+            end = start.copy()
+            end.forward_char()
+        else:
+            end = self._iter(last)
+        return start, end
+
     def tag_add(self, tag_name, first, last=None):
-        pass
+        self._buffer.apply_tag(self._tag(tag_name), *self._range(first, last))
+
+    def tag_remove(self, tag_name, first, last=None):
+        tag = self._buffer.get_tag_table().lookup(tag_name)
+        if tag is not None:
+            self._buffer.remove_tag(tag, *self._range(first, last))
+
+    def tag_delete(self, *tag_names):
+        table = self._buffer.get_tag_table()
+        for tag_name in tag_names:
+            tag = table.lookup(tag_name)
+            if tag is not None:
+                table.remove(tag)
+                self._lexed_tags.discard(tag)
+
+    def tag_names(self):
+        names = []
+        self._buffer.get_tag_table().foreach(lambda tag: names.append(tag.props.name))
+        return tuple(name for name in names if name)
 
     def tag_config(self, tag_name, **kwargs):
-        pass
+        tag = self._tag(tag_name)
+        for key, value in kwargs.items():
+            if key == 'font':
+                tag.set_property('font-desc', self._parse_font(value))
+            elif key == 'underline':
+                tag.set_property('underline', Pango.Underline.SINGLE if value else Pango.Underline.NONE)
+            elif key == 'justify':
+                justification = {'left': Gtk.Justification.LEFT, 'right': Gtk.Justification.RIGHT,
+                                 'center': Gtk.Justification.CENTER}.get(value, Gtk.Justification.LEFT)
+                tag.set_property('justification', justification)
+            elif key in self._tag_properties:
+                tag.set_property(self._tag_properties[key], value)
+            else:
+                print(f"Warning: Unknown tag option '{key}'")
+
+    tag_configure = tag_config
+
+    def set_highlighter(self, lexer, styles=None):
+        buffer = self._buffer
+        for handler in self._lexer_handlers:
+            buffer.disconnect(handler)
+        for tag in self._lexed_tags:
+            buffer.remove_tag(tag, buffer.get_start_iter(), buffer.get_end_iter())
+        self._lexed_tags = set()
+        self._lexer = lexer
+        if lexer is None:
+            self._lexer_handlers = ()
+            self._line_states = []
+            self._dirty = None
+            return
+        for tag_name, options in (styles or {}).items():
+            self.tag_config(tag_name, **options)
+        self._lexer_handlers = (buffer.connect("insert-text", self._on_lexed_insert),
+                                buffer.connect("delete-range", self._on_lexed_delete))
+        count = buffer.get_line_count()
+        self._line_states = [_UNLEXED] * count
+        self._dirty = None
+        self._mark_dirty(0, count)
+
+    def _mark_dirty(self, first, last):
+        if self._dirty is None:
+            self._dirty = [first, last]
+        else:
+            self._dirty[0] = min(self._dirty[0], first)
+            self._dirty[1] = max(self._dirty[1], last)
+        if self._highlight_source is None:
+            self._highlight_source = GLib.idle_add(self._highlight_step)
+
+    def _on_lexed_insert(self, buffer, location, text, length):
+        line = location.get_line()
+        added = text.count('\n')
+        if added:
+            self._line_states[line:line] = [_UNLEXED] * added
+            if self._dirty is not None and self._dirty[1] > line:
+                self._dirty[1] += added
+        self._mark_dirty(line, line + added)
+
+    def _on_lexed_delete(self, buffer, start, end):
+        first, last = start.get_line(), end.get_line()
+        removed = last - first
+        if removed:
+            del self._line_states[first:last]
+            dirty = self._dirty
+            if dirty is not None:
+                dirty[0] = dirty[0] - removed if dirty[0] > last else min(dirty[0], first)
+                dirty[1] = dirty[1] - removed if dirty[1] > last else min(dirty[1], first)
+        self._mark_dirty(first, first)
+
+    def _highlight_step(self):
+        if self._lexer is None or self._dirty is None:
+            self._highlight_source = None
+            return False
+        buffer = self._buffer
+        states = self._line_states
+        lexed_tags = self._lexed_tags
+        deadline = time.perf_counter() + self._highlight_budget
+        line, until = self._dirty
+        count = buffer.get_line_count()
+        if len(states) != count:
+            del states[count:]
+            states.extend([_UNLEXED] * (count - len(states)))
+        tags = {}
+        while line < count:
+            start = buffer.get_iter_at_line(line)
+            end = start.copy()
+            if not end.ends_line():
+                end.forward_to_line_end()
+            tokens, state = self._lexer(buffer.get_text(start, end, True), states[line - 1] if line else None)
+            for tag in lexed_tags:
+                buffer.remove_tag(tag, start, end)
+            for first, last, tag_name in tokens:
+                tag = tags.get(tag_name)
+                if tag is None:
+                    tag = tags[tag_name] = self._tag(tag_name)
+                    lexed_tags.add(tag)
+                token_start = start.copy()
+                token_start.set_line_offset(first)
+                token_end = start.copy()
+                token_end.set_line_offset(last)
+                buffer.apply_tag(tag, token_start, token_end)
+            previous = states[line]
+            states[line] = state
+            line += 1
+            if line > until and state == previous:
+                break
+            if time.perf_counter() >= deadline:
+                self._dirty = [line, max(until, line)]
+                return True
+        self._dirty = None
+        self._highlight_source = None
+        return False
+
+
+class TextHandler(logging.Handler):
+    def __init__(self, text, level=logging.NOTSET):
+        super().__init__(level)
+        self.text = text
+
+    def emit(self, record):
+        try:
+            self.text.write(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
 
 
 class Frame(Widget):
@@ -860,19 +1645,25 @@ class Frame(Widget):
 
 
 class Checkbutton(Widget):
+    _create_options = ('variable',)
+
     def _create_widget(self, **kwargs):
         check = Gtk.CheckButton(label=kwargs.get('text', ''))
         if 'variable' in kwargs:
             self._variable = kwargs['variable']
             check.set_active(self._variable.get())
+            self._trace_variable(self._variable, self._update_check)
             check.connect("toggled", self._update_var)
         return check
 
     def _set_text(self, text):
         self._widget.set_label(text)
 
+    def _update_check(self, *args):
+        self._widget.set_active(bool(self._variable.get()))
+
     def _update_var(self, widget):
-        self._variable.set(widget.get_active())
+        self._variable._set(widget.get_active(), self._update_check)
 
     def select(self):
         self._widget.set_active(True)
@@ -915,44 +1706,493 @@ class Radiobutton(Widget):
         self._widget.set_active(False)
 
 
+def _string_row(values):
+    return tuple(str(value) for value in values)
+
+
+class _VirtualRows(GObject.Object, Gtk.TreeModel):
+    def __init__(self, rows, count, gtypes, convert, cache_size):
+        super().__init__()
+        self._rows = rows
+        self._count = len(rows) if count is None else count
+        self._gtypes = gtypes
+        self._convert = convert
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+
+    def __len__(self):
+        return self._count
+
+    def row(self, index):
+        row = self._cache.get(index)
+        if row is not None:
+            self._cache.move_to_end(index)
+            return row
+        value = self._rows(index) if callable(self._rows) else self._rows[index]
+        if not isinstance(value, (tuple, list)):
+            value = (value,)
+        row = self._convert(value)
+        self._cache[index] = row
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return row
+
+    def source_count(self):
+        return self._count if callable(self._rows) else len(self._rows)
+
+    def resized(self, count):
+        return _VirtualRows(self._rows, count, self._gtypes, self._convert, self._cache_size)
+
+    def resize(self, count):
+        self._cache.clear()
+        while self._count > count:
+            self._count -= 1
+            self.row_deleted(Gtk.TreePath.new_from_indices([self._count]))
+        while self._count < count:
+            self._count += 1
+            self.row_inserted(Gtk.TreePath.new_from_indices([self._count - 1]), self._iter(self._count - 1))
+
+    def _iter(self, index):
+        treeiter = Gtk.TreeIter()
+        treeiter.user_data = index + 1
+        return treeiter
+
+    def do_get_flags(self):
+        return Gtk.TreeModelFlags.LIST_ONLY | Gtk.TreeModelFlags.ITERS_PERSIST
+
+    def do_get_n_columns(self):
+        return len(self._gtypes)
+
+    def do_get_column_type(self, column):
+        return self._gtypes[column]
+
+    def do_get_iter(self, path):
+        index = path.get_indices()[0]
+        if 0 <= index < self._count:
+            return True, self._iter(index)
+        return False, None
+
+    def do_get_path(self, treeiter):
+        return Gtk.TreePath.new_from_indices([treeiter.user_data - 1])
+
+    def do_get_value(self, treeiter, column):
+        return self.row(treeiter.user_data - 1)[column]
+
+    def do_iter_next(self, treeiter):
+        if treeiter.user_data < self._count:
+            treeiter.user_data += 1
+            return True
+        return False
+
+    def do_iter_previous(self, treeiter):
+        if treeiter.user_data > 1:
+            treeiter.user_data -= 1
+            return True
+        return False
+
+    def do_iter_children(self, parent):
+        return self.do_iter_nth_child(parent, 0)
+
+    def do_iter_has_child(self, treeiter):
+        return False
+
+    def do_iter_n_children(self, treeiter):
+        return self._count if treeiter is None else 0
+
+    def do_iter_nth_child(self, parent, n):
+        if parent is None and 0 <= n < self._count:
+            return True, self._iter(n)
+        return False, None
+
+    def do_iter_parent(self, child):
+        return False, None
+
+
+class _ValueIndex:
+    _scan_limit = 16
+
+    def __init__(self, values=()):
+        self.reset(values)
+
+    def reset(self, values=()):
+        self.values = [str(value) for value in values]
+        self._rows = None
+        self._scans = 0
+        self._ordering = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def _order(self):
+        ordering = self._ordering
+        if ordering is None:
+            ordered = sorted(self.values, key=str.casefold)
+            ordering = self._ordering = (ordered, [value.casefold() for value in ordered])
+        return ordering
+
+    def insert(self, position, values):
+        values = [str(value) for value in values]
+        if position >= len(self.values):
+            start = len(self.values)
+            self.values.extend(values)
+            rows = self._rows
+            if rows is not None:
+                for row, value in enumerate(values, start):
+                    rows.setdefault(value, row)
+        else:
+            self.values[position:position] = values
+            self._rows = None
+            self._scans = 0
+        ordering = self._ordering
+        if ordering is None:
+            return
+        ordered, keys = ordering
+        if len(values) * 8 > len(keys):
+            self._ordering = None
+            return
+        for value in values:
+            key = value.casefold()
+            i = bisect_right(keys, key)
+            keys.insert(i, key)
+            ordered.insert(i, value)
+
+    def delete(self, first, last):
+        removed = self.values[first:last]
+        del self.values[first:last]
+        self._rows = None
+        self._scans = 0
+        ordering = self._ordering
+        if ordering is None:
+            return
+        ordered, keys = ordering
+        if len(removed) * 8 > len(keys):
+            self._ordering = None
+            return
+        for value in removed:
+            i = bisect_left(keys, value.casefold())
+            while ordered[i] != value:
+                i += 1
+            del keys[i]
+            del ordered[i]
+
+    def row(self, value):
+        value = str(value)
+        rows = self._rows
+        if rows is None:
+            if self._scans < self._scan_limit:
+                self._scans += 1
+                try:
+                    return self.values.index(value)
+                except ValueError:
+                    return None
+            values = self.values
+            rows = self._rows = dict(zip(reversed(values), range(len(values) - 1, -1, -1)))
+        return rows.get(value)
+
+    def prefix(self, prefix, limit=None):
+        ordered, keys = self._order()
+        key = prefix.casefold()
+        start = bisect_left(keys, key)
+        end = start
+        stop = len(keys) if limit is None else min(len(keys), start + limit)
+        while end < stop and keys[end].startswith(key):
+            end += 1
+        return ordered[start:end]
+
+    def fuzzy(self, query, limit, cancelled=None):
+        ordered, keys = self._order()
+        pattern = re.compile('.*?'.join(map(re.escape, query.casefold())))
+        search = pattern.search
+        best = []
+        for i, key in enumerate(keys):
+            if cancelled is not None and not i & 0x3fff and cancelled():
+                return None
+            match = search(key)
+            if match is not None:
+                score = (-(match.end() - match.start()), -match.start(), -len(key), -i)
+                if len(best) < limit:
+                    heapq.heappush(best, score)
+                elif score > best[0]:
+                    heapq.heapreplace(best, score)
+        return [ordered[-score[3]] for score in sorted(best, reverse=True)]
+
+
+class _RowStream:
+    def __init__(self, append, iterable, chunk, budget_ms, on_progress, on_done, on_error=None, loop=None):
+        self._append = append
+        self._chunk = chunk
+        self._budget = budget_ms / 1000
+        self._on_progress = on_progress
+        self._on_done = on_done
+        self._on_error = on_error
+        self.count = 0
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        if hasattr(iterable, '__aiter__'):
+            self._rows = None
+            self._pending = SimpleQueue()
+            if loop is None:
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    loop = None
+            if loop is None:
+                threading.Thread(target=asyncio.run, args=(self._drain(iterable),), daemon=True).start()
+            else:
+                asyncio.run_coroutine_threadsafe(self._drain(iterable), loop)
+        else:
+            self._rows = iter(iterable)
+            if self._step():
+                GLib.idle_add(self._step)
+
+    def cancel(self):
+        self.cancelled = True
+        if self._rows is not None and hasattr(self._rows, 'close'):
+            self._rows.close()
+
+    def _step(self):
+        if self.cancelled or self.done or self.error is not None:
+            return False
+        deadline = time.perf_counter() + self._budget
+        count = self.count
+        more = True
+        error = None
+        while time.perf_counter() < deadline:
+            try:
+                if self._rows is not None:
+                    rows = list(islice(self._rows, self._chunk))
+                else:
+                    rows = self._pending.get_nowait()
+                    if isinstance(rows, Exception):
+                        raise rows
+            except Empty:
+                more = False
+                break
+            except Exception as failure:
+                error = failure
+                break
+            if not rows:
+                self.done = True
+                break
+            self._append(rows)
+            self.count += len(rows)
+        if self._on_progress is not None and self.count != count:
+            self._on_progress(self.count)
+        if error is not None:
+            self.error = error
+            if self._on_error is None:
+                raise error
+            self._on_error(error)
+            return False
+        if self.done and self._on_done is not None:
+            self._on_done(self.count)
+        return more and not self.done
+
+    async def _drain(self, iterable):
+        batch = []
+        flushed = time.perf_counter()
+        try:
+            async for row in iterable:
+                if self.cancelled:
+                    break
+                batch.append(row)
+                if len(batch) >= self._chunk or time.perf_counter() - flushed >= self._budget:
+                    self._pending.put(batch)
+                    GLib.idle_add(self._step)
+                    batch = []
+                    flushed = time.perf_counter()
+        except Exception as error:
+            if batch:
+                self._pending.put(batch)
+            self._pending.put(error)
+        else:
+            if batch:
+                self._pending.put(batch)
+            self._pending.put([])
+        GLib.idle_add(self._step)
+
+
+def _set_virtual_rows(treeview, model, fallback):
+    virtual = model is not None
+    for column in treeview.get_columns():
+        column.set_sizing(Gtk.TreeViewColumnSizing.FIXED if virtual else Gtk.TreeViewColumnSizing.GROW_ONLY)
+        column.set_expand(True)
+    treeview.set_model(model if virtual else fallback)
+    treeview.set_fixed_height_mode(virtual)
+    return model
+
+
+def _refresh_virtual_rows(treeview, model, count, fallback, limit):
+    if count is None:
+        count = model.source_count()
+    if abs(count - len(model)) > limit:
+        return _set_virtual_rows(treeview, model.resized(count), fallback)
+    model.resize(count)
+    treeview.queue_draw()
+    return model
+
+
 class Listbox(Widget):
+    _create_options = ('rows', 'count')
+    _detach_threshold = 64
+    _row_cache_size = 4096
+    _typeahead_timeout = 1.0
+
     def _create_widget(self, **kwargs):
         self._liststore = Gtk.ListStore(str)
         self._treeview = Gtk.TreeView(model=self._liststore)
+        self._lookup = _ValueIndex()
+        self._typeahead = ''
+        self._typeahead_time = 0.0
 
         renderer = Gtk.CellRendererText()
         column = Gtk.TreeViewColumn("Items", renderer, text=0)
         self._treeview.append_column(column)
+        self._treeview.set_enable_search(False)
+        self._treeview.connect("key-press-event", self._on_typeahead)
 
         self._widget = Gtk.ScrolledWindow()
         self._widget.add(self._treeview)
+        self._virtual = None
+        if kwargs.get('rows') is not None:
+            self.set_rows(kwargs['rows'], kwargs.get('count'))
         return self._widget
 
+    def set_rows(self, rows, count=None):
+        model = None if rows is None else _VirtualRows(rows, count, [str], _string_row, self._row_cache_size)
+        self._virtual = _set_virtual_rows(self._treeview, model, self._liststore)
+
+    def refresh(self, count=None):
+        if self._virtual is not None:
+            self._virtual = _refresh_virtual_rows(self._treeview, self._virtual, count, self._liststore,
+                                                  self._detach_threshold)
+
+    def _index(self, index):
+        if index == 'end':
+            return len(self._liststore)
+        return int(index)
+
+    def _detach(self, count):
+        if count < self._detach_threshold:
+            return None
+        model = self._treeview.get_model()
+        self._treeview.set_model(None)
+        return model
+
+    def _attach(self, model):
+        if model is not None:
+            self._treeview.set_model(model)
+
+    def _check_editable(self):
+        if self._virtual is not None:
+            raise ValueError("Listbox shows virtual rows; edit the row source and call refresh()")
+
     def insert(self, index, text):
+        self._check_editable()
+        self._lookup.insert(self._index(index), [text])
         if index == 'end':
             self._liststore.append([text])
         else:
             self._liststore.insert(index, [text])
 
+    def insert_many(self, index, items):
+        self._check_editable()
+        if not hasattr(items, '__len__'):
+            items = list(items)
+        detached = self._detach(len(items))
+        self._insert_rows(index, items)
+        self._attach(detached)
+
+    def _insert_rows(self, index, items):
+        self._check_editable()
+        store = self._liststore
+        insert = store.insert_with_valuesv
+        columns = [0]
+        items = [str(text) for text in items]
+        position = self._index(index)
+        self._lookup.insert(position, items)
+        if position >= len(store):
+            for text in items:
+                insert(-1, columns, [text])
+        else:
+            for position, text in enumerate(items, position):
+                insert(position, columns, [text])
+
+    def stream(self, iterable, chunk=500, budget_ms=8, on_progress=None, on_done=None, on_error=None, loop=None):
+        self._check_editable()
+        return _RowStream(partial(self._insert_rows, 'end'), iterable, chunk, budget_ms, on_progress, on_done,
+                          on_error, loop)
+
     def delete(self, first, last=None):
-        if last is None:
-            path = Gtk.TreePath.new_from_string(str(first))
-            iter = self._liststore.get_iter(path)
-            self._liststore.remove(iter)
+        self._check_editable()
+        store = self._liststore
+        first = self._index(first)
+        last = first + 1 if last is None else min(self._index(last), len(store))
+        count = last - first
+        if count <= 0:
+            return
+        self._lookup.delete(first, last)
+        detached = self._detach(count)
+        if count == len(store):
+            store.clear()
         else:
-            for i in range(first, last):
-                path = Gtk.TreePath.new_from_string(str(i))
-                iter = self._liststore.get_iter(path)
-                self._liststore.remove(iter)
+            treeiter = store.iter_nth_child(None, first)
+            for _ in range(count):
+                if not store.remove(treeiter):
+                    break
+        self._attach(detached)
 
     def get(self, index):
+        if self._virtual is not None:
+            return self._virtual.row(index)[0]
         path = Gtk.TreePath.new_from_string(str(index))
         iter = self._liststore.get_iter(path)
         return self._liststore.get_value(iter, 0)
 
     def size(self):
+        if self._virtual is not None:
+            return len(self._virtual)
         return len(self._liststore)
 
+    def find(self, value):
+        return self._lookup.row(value)
+
+    def find_prefix(self, prefix):
+        matches = self._lookup.prefix(prefix, 1)
+        return self._lookup.row(matches[0]) if matches else None
+
+    def complete(self, prefix, limit=None):
+        return self._lookup.prefix(prefix, limit)
+
+    def select_value(self, value):
+        row = self.find(value)
+        if row is None:
+            self._treeview.get_selection().unselect_all()
+            return False
+        self._select_row(row)
+        return True
+
+    def _select_row(self, row):
+        path = Gtk.TreePath.new_from_indices([row])
+        self._treeview.set_cursor(path, None, False)
+        self._treeview.scroll_to_cell(path, None, False, 0, 0)
+
+    def _on_typeahead(self, widget, event):
+        char = event.string
+        if not char or not char.isprintable() or event.state & (Gdk.ModifierType.CONTROL_MASK |
+                                                               Gdk.ModifierType.MOD1_MASK):
+            return False
+        now = time.monotonic()
+        if now - self._typeahead_time > self._typeahead_timeout:
+            self._typeahead = ''
+        self._typeahead += char
+        self._typeahead_time = now
+        row = self.find_prefix(self._typeahead)
+        if row is not None:
+            self._select_row(row)
+        return True
+
 
 class Scrollbar(Widget):
     def _create_widget(self, **kwargs):
@@ -961,11 +2201,537 @@ class Scrollbar(Widget):
         return Gtk.HScrollbar()
 
 
+_exhaust = deque(maxlen=0).extend
+
+
+def _as_doubles(values):
+    try:
+        view = memoryview(values)
+    except TypeError:
+        view = None
+    if view is not None and view.format == 'd' and view.c_contiguous:
+        data = array('d')
+        data.frombytes(view.cast('B'))
+        return data
+    data = array('d')
+    for value in values:
+        if hasattr(value, '__len__'):
+            data.extend(value)
+        else:
+            data.append(value)
+    return data
+
+
+def _pack_color(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        rgba = Gdk.RGBA()
+        if not rgba.parse(value):
+            raise ValueError(f"Unknown color '{value}'")
+        value = (rgba.red, rgba.green, rgba.blue)
+    if hasattr(value, '__len__'):
+        return (int(value[0] * 255) << 16) | (int(value[1] * 255) << 8) | int(value[2] * 255)
+    return int(value)
+
+
+def _as_packed_colors(values, count):
+    data = array('I', map(_pack_color, values))
+    if len(data) != count:
+        raise ValueError(f"Expected {count} colors, got {len(data)}")
+    return data
+
+
+def _unpack_color(packed):
+    return (((packed >> 16) & 0xff) / 255.0, ((packed >> 8) & 0xff) / 255.0, (packed & 0xff) / 255.0)
+
+
+def _boxes_intersect(a, b):
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+def _box_distance(box, x, y):
+    return math.hypot(max(box[0] - x, 0.0, x - box[2]), max(box[1] - y, 0.0, y - box[3]))
+
+
+def _segment_distance(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    t = 0.0 if not length else max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length))
+    return math.hypot(px - x1 - t * dx, py - y1 - t * dy)
+
+
+def _segment_hits_box(x1, y1, x2, y2, box):
+    t0, t1 = 0.0, 1.0
+    dx, dy = x2 - x1, y2 - y1
+    for p, q in ((-dx, x1 - box[0]), (dx, box[2] - x1), (-dy, y1 - box[1]), (dy, box[3] - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+        elif p < 0:
+            t0 = max(t0, q / p)
+        else:
+            t1 = min(t1, q / p)
+        if t0 > t1:
+            return False
+    return True
+
+
+def _oval_circle(x1, y1, x2, y2):
+    return (x1 + x2) / 2, (y1 + y2) / 2, min(abs(x2 - x1), abs(y2 - y1)) / 2
+
+
+def _rectangle_path(cr, coords, offset):
+    x1, y1, x2, y2 = coords[offset:offset + 4]
+    cr.rectangle(x1, y1, x2 - x1, y2 - y1)
+
+
+def _oval_path(cr, coords, offset):
+    cx, cy, radius = _oval_circle(*coords[offset:offset + 4])
+    cr.new_sub_path()
+    cr.arc(cx, cy, radius, 0, 2 * math.pi)
+
+
+def _line_path(cr, coords, offset):
+    cr.move_to(coords[offset], coords[offset + 1])
+    cr.line_to(coords[offset + 2], coords[offset + 3])
+
+
+class _SpatialGrid:
+    def __init__(self, cell=64):
+        self.cell = cell
+        self._cells = {}
+        self._memos = {}
+        self._bounds = None
+        self._shared = False
+        self._owned = None
+
+    def _span(self, bbox):
+        cell = self.cell
+        return (math.floor(bbox[0] / cell), math.floor(bbox[1] / cell),
+                math.floor(bbox[2] / cell), math.floor(bbox[3] / cell))
+
+    def _writable(self):
+        if self._shared:
+            self._cells = dict(self._cells)
+            self._shared = False
+        return self._cells
+
+    def _bucket(self, cells, cell):
+        bucket = cells[cell]
+        owned = self._owned
+        if owned is not None and cell not in owned:
+            bucket = cells[cell] = bucket[:]
+            owned.add(cell)
+        return bucket
+
+    def insert(self, key, bbox):
+        cx1, cy1, cx2, cy2 = self._span(bbox)
+        cells = self._writable()
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                if (cx, cy) in cells:
+                    bucket = self._bucket(cells, (cx, cy))
+                else:
+                    bucket = cells[(cx, cy)] = array('q')
+                    if self._owned is not None:
+                        self._owned.add((cx, cy))
+                    self._memos = {}
+                    self._bounds = None
+                bucket.append(key)
+
+    def remove(self, key, bbox):
+        cx1, cy1, cx2, cy2 = self._span(bbox)
+        cells = self._writable()
+        self._memos = {}
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is not None and key in bucket:
+                    bucket = self._bucket(cells, (cx, cy))
+                    bucket.remove(key)
+                    if not bucket:
+                        del cells[(cx, cy)]
+                        self._bounds = None
+
+    def move(self, key, old_bbox, new_bbox):
+        if self._span(old_bbox) != self._span(new_bbox):
+            self.remove(key, old_bbox)
+            self.insert(key, new_bbox)
+
+    def __len__(self):
+        return len(self._cells)
+
+    def clear(self):
+        self._cells = {}
+        self._memos = {}
+        self._bounds = None
+        self._shared = False
+        self._owned = None
+
+    def snapshot(self):
+        copy = _SpatialGrid(self.cell)
+        copy._cells = self._cells
+        copy._memos = self._memos
+        copy._bounds = self._bounds
+        self._shared = True
+        self._owned = set()
+        return copy
+
+    def keys(self):
+        return set().union(*self._cells.values())
+
+    def memo(self, key, build):
+        memos = self._memos
+        if key not in memos:
+            memos[key] = build()
+        return memos[key]
+
+    def invalidate(self):
+        self._memos = {}
+
+    def bounds(self):
+        if self._bounds is None and self._cells:
+            xs = [cx for cx, cy in self._cells]
+            ys = [cy for cx, cy in self._cells]
+            self._bounds = (min(xs), min(ys), max(xs), max(ys))
+        return self._bounds
+
+    def covers(self, x1, y1, x2, y2):
+        bounds = self.bounds()
+        if bounds is None:
+            return True
+        cx1, cy1, cx2, cy2 = self._span((x1, y1, x2, y2))
+        return cx1 <= bounds[0] and cy1 <= bounds[1] and cx2 >= bounds[2] and cy2 >= bounds[3]
+
+    def cell_count(self, x1, y1, x2, y2):
+        cx1, cy1, cx2, cy2 = self._span((x1, y1, x2, y2))
+        return (cx2 - cx1 + 1) * (cy2 - cy1 + 1)
+
+    def query(self, x1, y1, x2, y2):
+        cx1, cy1, cx2, cy2 = self._span((x1, y1, x2, y2))
+        cells = self._cells
+        found = set()
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(cells):
+            for (cx, cy), bucket in cells.items():
+                if cx1 <= cx <= cx2 and cy1 <= cy <= cy2:
+                    found.update(bucket)
+            return found
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket:
+                    found.update(bucket)
+        return found
+
+
+_EASINGS = {
+    'linear': lambda t: t,
+    'ease': lambda t: t * t * (3 - 2 * t),
+    'ease-in': lambda t: t * t,
+    'ease-out': lambda t: 1 - (1 - t) * (1 - t),
+}
+
+_RECTANGLE, _OVAL, _LINE, _TEXT, _POLYLINE, _RECTANGLES = range(6)
+_ITEM_TYPES = ('rectangle', 'oval', 'line', 'text', 'polyline', 'rectangles')
+_ITEM_ARITY = (4, 4, 4, 2, 0, 0)
+_ITEM_OPTIONS = (
+    ('fill', 'outline', 'width'),
+    ('fill', 'outline', 'width'),
+    ('fill', 'width'),
+    ('fill', 'text', 'font', 'width'),
+    ('fill', 'width'),
+    ('fill', 'fills', 'outline', 'width'),
+)
+_HAS_FILL, _HAS_OUTLINE, _HAS_WIDTH = 1, 2, 4
+
+
+class _ItemColumns:
+    __slots__ = ('arity', 'ids', 'coords', 'bbox', 'fill', 'outline', 'width', 'flags', 'layer', 'extra', 'shared')
+    _names = ('ids', 'coords', 'bbox', 'fill', 'outline', 'width', 'flags', 'layer', 'extra')
+
+    def __init__(self, arity):
+        self.arity = arity
+        self.ids = array('q')
+        self.coords = array('d')
+        self.bbox = array('d')
+        self.fill = array('I')
+        self.outline = array('I')
+        self.width = array('f')
+        self.flags = array('B')
+        self.layer = array('H')
+        self.extra = None if arity == 4 else []
+        self.shared = None
+
+    def own(self, *names):
+        shared = self.shared
+        if shared:
+            for name in names or self._names:
+                if name in shared:
+                    shared.discard(name)
+                    column = getattr(self, name)
+                    if column is not None:
+                        setattr(self, name, column[:])
+
+    def snapshot(self):
+        copy = _ItemColumns.__new__(_ItemColumns)
+        copy.arity = self.arity
+        copy.shared = None
+        for name in self._names:
+            setattr(copy, name, getattr(self, name))
+        self.shared = set(self._names)
+        return copy
+
+
+class _ItemStore:
+    def __init__(self):
+        self.columns = tuple(_ItemColumns(arity) for arity in _ITEM_ARITY)
+        self.loc = array('q', [-1])
+        self.tags = {}
+        self.count = 0
+        self._loc_shared = False
+
+    def _own_loc(self):
+        if self._loc_shared:
+            self.loc = self.loc[:]
+            self._loc_shared = False
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, item_id):
+        return isinstance(item_id, int) and 0 < item_id < len(self.loc) and self.loc[item_id] >= 0
+
+    def locate(self, item_id):
+        value = self.loc[item_id]
+        return value >> 32, value & 0xffffffff
+
+    def ids(self):
+        found = []
+        for cols in self.columns:
+            found.extend(cols.ids)
+        found.sort()
+        return found
+
+    def add(self, kind, coords, bbox, fill, outline, width, layer, extra):
+        cols = self.columns[kind]
+        cols.own()
+        self._own_loc()
+        item_id = len(self.loc)
+        self.loc.append(kind << 32 | len(cols.ids))
+        cols.ids.append(item_id)
+        cols.coords.extend(coords)
+        cols.bbox.extend(bbox)
+        cols.fill.append(fill or 0)
+        cols.outline.append(outline or 0)
+        cols.width.append(width or 0)
+        cols.flags.append((_HAS_FILL if fill is not None else 0) |
+                          (_HAS_OUTLINE if outline is not None else 0) |
+                          (_HAS_WIDTH if width is not None else 0))
+        cols.layer.append(layer)
+        if cols.extra is not None:
+            cols.extra.append(extra)
+        self.count += 1
+        return item_id
+
+    def remove(self, item_id):
+        kind, row = self.locate(item_id)
+        cols = self.columns[kind]
+        cols.own()
+        self._own_loc()
+        arity = cols.arity
+        last = len(cols.ids) - 1
+        if row != last:
+            moved = cols.ids[last]
+            cols.ids[row] = moved
+            cols.coords[row * arity:row * arity + arity] = cols.coords[last * arity:]
+            cols.bbox[row * 4:row * 4 + 4] = cols.bbox[last * 4:]
+            cols.fill[row] = cols.fill[last]
+            cols.outline[row] = cols.outline[last]
+            cols.width[row] = cols.width[last]
+            cols.flags[row] = cols.flags[last]
+            cols.layer[row] = cols.layer[last]
+            if cols.extra is not None:
+                cols.extra[row] = cols.extra[last]
+            self.loc[moved] = kind << 32 | row
+        cols.ids.pop()
+        del cols.coords[last * arity:]
+        del cols.bbox[last * 4:]
+        cols.fill.pop()
+        cols.outline.pop()
+        cols.width.pop()
+        cols.flags.pop()
+        cols.layer.pop()
+        if cols.extra is not None:
+            cols.extra.pop()
+        self.loc[item_id] = -1
+        self.tags.pop(item_id, None)
+        self.count -= 1
+
+    def snapshot(self):
+        copy = _ItemStore()
+        copy.columns = tuple(cols.snapshot() for cols in self.columns)
+        copy.loc = self.loc
+        copy.count = self.count
+        self._loc_shared = True
+        return copy
+
+    def clear(self):
+        self.columns = tuple(_ItemColumns(arity) for arity in _ITEM_ARITY)
+        self.loc = array('q', [-1]) * len(self.loc)
+        self.tags.clear()
+        self.count = 0
+        self._loc_shared = False
+
+
+class _TextLayouts:
+    def __init__(self, parse_font, size):
+        self._parse_font = parse_font
+        self.size = size
+        self._layouts = OrderedDict()
+        self._fonts = {}
+        self._context = None
+
+    def get(self, text, font, width=None):
+        if isinstance(font, list):
+            font = tuple(font)
+        key = (text, font, width)
+        entry = self._layouts.get(key)
+        if entry is not None:
+            self._layouts.move_to_end(key)
+            return entry
+        if self._context is None:
+            self._context = PangoCairo.FontMap.get_default().create_context()
+        description = self._fonts.get(font)
+        if description is None:
+            description = self._fonts[font] = self._parse_font(font)
+        layout = Pango.Layout.new(self._context)
+        layout.set_font_description(description)
+        if width:
+            layout.set_width(int(width * Pango.SCALE))
+            layout.set_wrap(Pango.WrapMode.WORD_CHAR)
+        layout.set_text(text, -1)
+        ink, logical = layout.get_pixel_extents()
+        baseline = layout.get_baseline() / Pango.SCALE
+        entry = (layout, baseline, (logical.x, logical.y - baseline,
+                                    logical.x + logical.width, logical.y + logical.height - baseline))
+        self._layouts[key] = entry
+        if len(self._layouts) > self.size:
+            self._layouts.popitem(last=False)
+        return entry
+
+    def extents(self, text, font, width=None):
+        return self.get(text, font, width)[2]
+
+    def clear(self):
+        self._layouts.clear()
+        self._fonts.clear()
+        self._context = None
+
+
+def _size_cell(bbox):
+    return 1 << max(0, math.frexp(max(bbox[2] - bbox[0], bbox[3] - bbox[1]))[1])
+
+
+class _CanvasLayer:
+    def __init__(self, name, position, cached):
+        self.name = name
+        self.position = position
+        self.cached = cached
+        self.index = _SpatialGrid()
+        self.sizes = {}
+        self.items = set()
+        self.surface = None
+        self._items_shared = False
+
+    @property
+    def count(self):
+        return len(self.items)
+
+    def add(self, item_id, bbox):
+        if self._items_shared:
+            self.items = set(self.items)
+            self._items_shared = False
+        self.items.add(item_id)
+        self.index.insert(item_id, bbox)
+        self._add_size(item_id, bbox)
+
+    def remove(self, item_id, bbox):
+        if self._items_shared:
+            self.items = set(self.items)
+            self._items_shared = False
+        self.items.discard(item_id)
+        self.index.remove(item_id, bbox)
+        self._remove_size(item_id, bbox)
+
+    def move(self, item_id, old_bbox, bbox):
+        self.index.move(item_id, old_bbox, bbox)
+        cell = _size_cell(bbox)
+        if cell == _size_cell(old_bbox):
+            grid = self.sizes[cell]
+            grid.move(item_id, old_bbox, bbox)
+            grid.invalidate()
+        else:
+            self._remove_size(item_id, old_bbox)
+            self._add_size(item_id, bbox)
+
+    def restyle(self, bbox):
+        self.sizes[_size_cell(bbox)].invalidate()
+
+    def _add_size(self, item_id, bbox):
+        cell = _size_cell(bbox)
+        grid = self.sizes.get(cell)
+        if grid is None:
+            grid = self.sizes[cell] = _SpatialGrid(max(cell, self.index.cell))
+        grid.insert(item_id, bbox)
+        grid.invalidate()
+
+    def _remove_size(self, item_id, bbox):
+        cell = _size_cell(bbox)
+        grid = self.sizes[cell]
+        grid.remove(item_id, bbox)
+        if len(grid):
+            grid.invalidate()
+        else:
+            del self.sizes[cell]
+
+    def snapshot(self):
+        copy = _CanvasLayer(self.name, self.position, self.cached)
+        copy.index = self.index.snapshot()
+        copy.sizes = {cell: grid.snapshot() for cell, grid in self.sizes.items()}
+        copy.items = self.items
+        self._items_shared = True
+        return copy
+
+
 class Canvas(Widget):
+    _damage_pad = 2
+    _batch_chunk = 4096
+    _lod_pixels = 2.0
+    _proxy_pixels = 6.0
+    _proxy_image_limit = 1 << 22
+    _scroll_increment = 10
+    _text_cache_size = 2048
+
     def _create_widget(self, **kwargs):
         self._drawing_area = Gtk.DrawingArea()
         self._drawing_area.connect("draw", self._on_draw)
-        self._items = []
+        self._drawing_area.connect("size-allocate", self._on_size_allocate)
+        self._drawing_area.connect("destroy", lambda widget: self._set_threaded(False))
+        self._init_items()
+        self._layer_size = None
+        self._item_events_connected = False
+        self._animation_frame = None
+        self._scale = 1.0
+        self._origin = (0.0, 0.0)
+        self._scrollregion = kwargs.get('scrollregion')
+        self._text_layouts = _TextLayouts(self._parse_font, self._text_cache_size)
+        self._painters = self._make_painters()
+        self._render_jobs = None
+        self._render_frame = None
+        self._rendering = False
+        self._render_dirty = False
+        self._frame_surface = None
         self._widget = Gtk.ScrolledWindow()
         self._widget.add(self._drawing_area)
 
@@ -973,82 +2739,1220 @@ class Canvas(Widget):
             width = kwargs.get('width', 200)
             height = kwargs.get('height', 200)
             self._drawing_area.set_size_request(width, height)
+        if kwargs.get('threaded'):
+            self._set_threaded(True)
 
         return self._widget
 
+    def _init_items(self):
+        self._store = _ItemStore()
+        self._tags = {}
+        self._layers = {}
+        self._layer_list = []
+        self._layer(None)
+        self._item_bindings = {}
+        self._current = None
+        self._animations = {}
+
+    def _make_painters(self):
+        return (
+            partial(self._paint_shapes, add_path=_rectangle_path),
+            partial(self._paint_shapes, add_path=_oval_path),
+            partial(self._paint_shapes, add_path=_line_path, stroke_fill=True),
+            self._paint_texts,
+            self._paint_polylines,
+            self._paint_rectangle_batches,
+        )
+
+    def _row(self, item_id):
+        kind, row = self._store.locate(item_id)
+        return kind, self._store.columns[kind], row
+
+    def _item_box(self, cols, row):
+        return tuple(cols.bbox[4 * row:4 * row + 4])
+
+    def _item_coords(self, cols, row):
+        arity = cols.arity
+        if arity:
+            return cols.coords[row * arity:row * arity + arity]
+        return cols.extra[row]['coords']
+
+    def _text_width(self, cols, row):
+        return cols.width[row] if cols.flags[row] & _HAS_WIDTH else None
+
+    def _half_width(self, cols, row):
+        return (cols.width[row] if cols.flags[row] & _HAS_WIDTH else 2.0) / 2
+
+    def _compute_bbox(self, kind, cols, row):
+        if kind in (_POLYLINE, _RECTANGLES):
+            cols.own('extra')
+            payload = cols.extra[row]
+            chunks = self._batch_chunks(kind, payload, self._half_width(cols, row))
+            payload = cols.extra[row] = dict(payload, chunks=chunks)
+            boxes = [chunk[2] for chunk in payload['chunks']] or [(0, 0, 0, 0)]
+            return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                    max(b[2] for b in boxes), max(b[3] for b in boxes))
+        coords = self._item_coords(cols, row)
+        if kind == _TEXT:
+            text, font = cols.extra[row]
+            x1, y1, x2, y2 = self._text_layouts.extents(text, font, self._text_width(cols, row))
+            x, y = coords
+            return (x + x1, y + y1, x + x2, y + y2)
+        pad = self._half_width(cols, row)
+        x1, y1, x2, y2 = coords
+        return (min(x1, x2) - pad, min(y1, y2) - pad, max(x1, x2) + pad, max(y1, y2) + pad)
+
+    def _batch_chunks(self, kind, payload, pad):
+        coords = payload['coords']
+        size = self._batch_chunk
+        chunks = []
+        if kind == _POLYLINE:
+            count = len(coords) // 2
+            for start in range(0, max(count - 1, 0), size):
+                end = min(start + size + 1, count)
+                xs = coords[2 * start:2 * end:2]
+                ys = coords[2 * start + 1:2 * end:2]
+                chunks.append((start, end, (min(xs) - pad, min(ys) - pad,
+                                            max(xs) + pad, max(ys) + pad)))
+            return chunks
+        for run_start, run_end in self._color_runs(payload):
+            for start in range(run_start, run_end, size):
+                end = min(start + size, run_end)
+                xs = coords[4 * start:4 * end:4]
+                ys = coords[4 * start + 1:4 * end:4]
+                x2s = list(map(add, xs, coords[4 * start + 2:4 * end:4]))
+                y2s = list(map(add, ys, coords[4 * start + 3:4 * end:4]))
+                chunks.append((start, end, (min(min(xs), min(x2s)) - pad, min(min(ys), min(y2s)) - pad,
+                                            max(max(xs), max(x2s)) + pad, max(max(ys), max(y2s)) + pad)))
+        return chunks
+
+    def _color_runs(self, payload):
+        count = len(payload['coords']) // 4
+        fills = payload['fills']
+        if fills is None:
+            return [(0, count)] if count else []
+        runs = []
+        start = 0
+        for i in range(1, count + 1):
+            if i == count or fills[i] != fills[start]:
+                runs.append((start, i))
+                start = i
+        return runs
+
+    def _damage(self, bbox):
+        if self._render_jobs is not None:
+            self._request_render()
+            return
+        pad = self._damage_pad
+        scale = self._scale
+        ox, oy = self._origin
+        x1 = math.floor((bbox[0] - ox) * scale) - pad
+        y1 = math.floor((bbox[1] - oy) * scale) - pad
+        x2 = math.ceil((bbox[2] - ox) * scale) + pad
+        y2 = math.ceil((bbox[3] - oy) * scale) + pad
+        self._drawing_area.queue_draw_area(x1, y1, x2 - x1, y2 - y1)
+
+    def _layer(self, name):
+        layer = self._layers.get(name)
+        if layer is None:
+            layer = _CanvasLayer(name, len(self._layer_list), cached=name is not None)
+            self._layers[name] = layer
+            self._layer_list.append(layer)
+        layer.surface = None
+        return layer
+
+    def _add_item(self, kind, coords, extra, kwargs, fill=None):
+        layer = self._layer(kwargs.get('layer'))
+        item_id = self._store.add(kind, coords, (0.0, 0.0, 0.0, 0.0),
+                                  _pack_color(kwargs.get('fill', fill)),
+                                  _pack_color(kwargs.get('outline')),
+                                  kwargs.get('width'), layer.position, extra)
+        kind, cols, row = self._row(item_id)
+        bbox = self._compute_bbox(kind, cols, row)
+        cols.bbox[4 * row:4 * row + 4] = array('d', bbox)
+        layer.add(item_id, bbox)
+        if kwargs.get('tags'):
+            self._set_tags(item_id, kwargs['tags'])
+        self._damage(bbox)
+        return item_id
+
+    def _remove_item(self, item_id):
+        kind, cols, row = self._row(item_id)
+        bbox = self._item_box(cols, row)
+        layer = self._layer(self._layer_list[cols.layer[row]].name)
+        self._item_bindings.pop(item_id, None)
+        self._end_animation(item_id)
+        if self._current == item_id:
+            self._current = None
+        for tag in self._store.tags.get(item_id, ()):
+            members = self._tags[tag]
+            members.discard(item_id)
+            if not members:
+                del self._tags[tag]
+        layer.remove(item_id, bbox)
+        self._store.remove(item_id)
+        self._damage(bbox)
+
+    def _reindex(self, item_id):
+        kind, cols, row = self._row(item_id)
+        old_bbox = self._item_box(cols, row)
+        bbox = self._compute_bbox(kind, cols, row)
+        cols.own('bbox')
+        cols.bbox[4 * row:4 * row + 4] = array('d', bbox)
+        layer = self._layer(self._layer_list[cols.layer[row]].name)
+        layer.move(item_id, old_bbox, bbox)
+        self._damage(old_bbox)
+        self._damage(bbox)
+
+    def _set_layer(self, item_id, name):
+        kind, cols, row = self._row(item_id)
+        old_layer = self._layer_list[cols.layer[row]]
+        if name == old_layer.name:
+            return
+        bbox = self._item_box(cols, row)
+        old_layer = self._layer(old_layer.name)
+        old_layer.remove(item_id, bbox)
+        new_layer = self._layer(name)
+        new_layer.add(item_id, bbox)
+        cols.own('layer')
+        cols.layer[row] = new_layer.position
+
+    def _on_size_allocate(self, widget, allocation):
+        size = (allocation.width, allocation.height)
+        if size != self._layer_size:
+            self._layer_size = size
+            for layer in self._layer_list:
+                layer.surface = None
+            self._redraw()
+
+    def _redraw(self):
+        if self._render_jobs is not None:
+            self._request_render()
+        else:
+            self._drawing_area.queue_draw()
+
+    def _set_tags(self, item_id, tags):
+        if isinstance(tags, str):
+            tags = (tags,)
+        for tag in self._store.tags.get(item_id, ()):
+            members = self._tags[tag]
+            members.discard(item_id)
+            if not members:
+                del self._tags[tag]
+        tags = tuple(dict.fromkeys(tags))
+        if tags:
+            self._store.tags[item_id] = tags
+        else:
+            self._store.tags.pop(item_id, None)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(item_id)
+
+    def _find(self, tag_or_id):
+        if isinstance(tag_or_id, int):
+            return (tag_or_id,) if tag_or_id in self._store else ()
+        if tag_or_id == 'all':
+            return tuple(self._store.ids())
+        if tag_or_id == 'current':
+            return (self._current,) if self._current in self._store else ()
+        if tag_or_id.isdigit():
+            return self._find(int(tag_or_id))
+        return tuple(self._tags.get(tag_or_id, ()))
+
+    def _candidates(self, x1, y1, x2, y2):
+        found = set()
+        for layer in self._layer_list:
+            found.update(layer.index.query(x1, y1, x2, y2))
+        return found
+
+    def _item_distance(self, item_id, x, y):
+        kind, cols, row = self._row(item_id)
+        coords = self._item_coords(cols, row)
+        half = self._half_width(cols, row)
+        filled = cols.flags[row] & _HAS_FILL
+        if kind == _LINE:
+            return max(0.0, _segment_distance(x, y, *coords) - half)
+        if kind == _OVAL:
+            cx, cy, radius = _oval_circle(*coords)
+            distance = math.hypot(x - cx, y - cy) - radius
+            if not filled:
+                distance = abs(distance)
+            return max(0.0, distance - half)
+        if kind == _RECTANGLE:
+            x1, y1, x2, y2 = coords
+            box = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+            distance = _box_distance(box, x, y)
+            if distance == 0 and not filled:
+                distance = min(x - box[0], box[2] - x, y - box[1], box[3] - y)
+            return max(0.0, distance - half)
+        if kind == _POLYLINE:
+            best = math.inf
+            for start, end, bbox in cols.extra[row]['chunks']:
+                if _box_distance(bbox, x, y) < best:
+                    for i in range(2 * start, 2 * end - 2, 2):
+                        best = min(best, _segment_distance(x, y, *coords[i:i + 4]))
+            return max(0.0, best - half)
+        if kind == _RECTANGLES:
+            best = math.inf
+            for start, end, bbox in cols.extra[row]['chunks']:
+                if _box_distance(bbox, x, y) < best:
+                    for i in range(4 * start, 4 * end, 4):
+                        rx, ry, rw, rh = coords[i:i + 4]
+                        best = min(best, _box_distance((rx, ry, rx + rw, ry + rh), x, y))
+            return best
+        return _box_distance(self._item_box(cols, row), x, y)
+
+    def _item_overlaps(self, item_id, box):
+        kind, cols, row = self._row(item_id)
+        if not _boxes_intersect(self._item_box(cols, row), box):
+            return False
+        coords = self._item_coords(cols, row)
+        half = self._half_width(cols, row)
+        filled = cols.flags[row] & _HAS_FILL
+        grown = (box[0] - half, box[1] - half, box[2] + half, box[3] + half)
+        if kind == _LINE:
+            return _segment_hits_box(*coords, grown)
+        if kind == _OVAL:
+            cx, cy, radius = _oval_circle(*coords)
+            if _box_distance(box, cx, cy) > radius + half:
+                return False
+            if filled:
+                return True
+            return max(math.hypot(x - cx, y - cy)
+                       for x in (box[0], box[2]) for y in (box[1], box[3])) >= radius - half
+        if kind == _RECTANGLE and not filled:
+            x1, y1, x2, y2 = coords
+            inner = (min(x1, x2) + half, min(y1, y2) + half, max(x1, x2) - half, max(y1, y2) - half)
+            return not (inner[0] < box[0] and box[2] < inner[2] and inner[1] < box[1] and box[3] < inner[3])
+        if kind == _POLYLINE:
+            for start, end, bbox in cols.extra[row]['chunks']:
+                if _boxes_intersect(bbox, box):
+                    for i in range(2 * start, 2 * end - 2, 2):
+                        if _segment_hits_box(*coords[i:i + 4], grown):
+                            return True
+            return False
+        if kind == _RECTANGLES:
+            for start, end, bbox in cols.extra[row]['chunks']:
+                if _boxes_intersect(bbox, box):
+                    for i in range(4 * start, 4 * end, 4):
+                        rx, ry, rw, rh = coords[i:i + 4]
+                        if _boxes_intersect((rx, ry, rx + rw, ry + rh), grown):
+                            return True
+            return False
+        return True
+
+    def _item_at(self, x, y):
+        hits = [item_id for item_id in self._candidates(x, y, x, y)
+                if self._item_distance(item_id, x, y) == 0]
+        return max(hits) if hits else None
+
+    def _visible(self, layer, x1, y1, x2, y2, limit=0.0):
+        store = self._store
+        if limit:
+            candidates = set()
+            for cell, grid in layer.sizes.items():
+                if cell >= 2 * limit:
+                    candidates.update(grid.query(x1, y1, x2, y2))
+        elif layer.index.cell_count(x1, y1, x2, y2) >= layer.count:
+            candidates = layer.items
+        else:
+            candidates = layer.index.query(x1, y1, x2, y2)
+        loc = store.loc
+        columns = store.columns
+        visible = []
+        for item_id in candidates:
+            value = loc[item_id]
+            bbox = columns[value >> 32].bbox
+            offset = (value & 0xffffffff) * 4
+            if bbox[offset] <= x2 and bbox[offset + 2] >= x1 and bbox[offset + 1] <= y2 and bbox[offset + 3] >= y1:
+                visible.append(item_id)
+        visible.sort()
+        return visible
+
     def _on_draw(self, widget, cr):
-        for item in self._items:
-            if item['type'] == 'rectangle':
-                cr.rectangle(item['x'], item['y'], item['width'], item['height'])
-                if 'fill' in item:
-                    cr.set_source_rgb(*item['fill'])
-                    cr.fill_preserve()
-                if 'outline' in item:
-                    cr.set_source_rgb(*item['outline'])
-                    cr.stroke()
-            elif item['type'] == 'oval':
-                cr.arc(item['x'] + item['width'] / 2, item['y'] + item['height'] / 2,
-                       min(item['width'], item['height']) / 2, 0, 2 * 3.1415926)
-                if 'fill' in item:
-                    cr.set_source_rgb(*item['fill'])
-                    cr.fill_preserve()
-                if 'outline' in item:
-                    cr.set_source_rgb(*item['outline'])
-                    cr.stroke()
-            elif item['type'] == 'line':
-                cr.move_to(item['x1'], item['y1'])
-                cr.line_to(item['x2'], item['y2'])
-                if 'fill' in item:
-                    cr.set_source_rgb(*item['fill'])
-                    cr.stroke()
-            elif item['type'] == 'text':
-                cr.move_to(item['x'], item['y'])
-                if 'font' in item:
-                    cr.set_font_size(item['font'][1])
-                cr.show_text(item['text'])
+        if self._render_jobs is not None:
+            if self._frame_surface is not None:
+                cr.set_source_surface(self._frame_surface, 0, 0)
+                cr.paint()
+            return
+        for layer in self._layer_list:
+            if layer.cached and layer.count:
+                if layer.surface is None:
+                    layer.surface = self._render_layer(widget, layer)
+                cr.set_source_surface(layer.surface, 0, 0)
+                cr.paint()
+        cr.save()
+        self._apply_view(cr)
+        self._paint(cr, self._layers[None])
+        cr.restore()
+
+    def _set_threaded(self, threaded):
+        if threaded and self._render_jobs is None:
+            self._render_jobs = SimpleQueue()
+            threading.Thread(target=self._render_worker, args=(self._render_jobs,), daemon=True).start()
+            self._request_render()
+        elif not threaded and self._render_jobs is not None:
+            self._render_jobs.put(None)
+            self._render_jobs = None
+            self._rendering = False
+            self._frame_surface = None
+            self._drawing_area.queue_draw()
+
+    def _snapshot(self):
+        scene = object.__new__(type(self))
+        scene._store = self._store.snapshot()
+        scene._layer_list = [layer.snapshot() for layer in self._layer_list]
+        scene._layers = {layer.name: layer for layer in scene._layer_list}
+        scene._scale = self._scale
+        scene._origin = self._origin
+        scene._painters = scene._make_painters()
+        return scene
+
+    def _request_render(self):
+        if self._render_frame is None:
+            self._render_frame = self.on_frame(self._start_render)
+
+    def _start_render(self, frame_time):
+        self._render_frame = None
+        if self._render_jobs is None:
+            return False
+        if self._rendering:
+            self._render_dirty = True
+            return False
+        widget = self._drawing_area
+        self._rendering = True
+        self._render_jobs.put((self._snapshot(), widget.get_allocated_width(),
+                               widget.get_allocated_height(), widget.get_scale_factor()))
+        return False
+
+    def _render_worker(self, jobs):
+        layouts = _TextLayouts(self._parse_font, self._text_cache_size)
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            scene, width, height, scale = job
+            scene._text_layouts = layouts
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, max(width, 1) * scale, max(height, 1) * scale)
+            surface.set_device_scale(scale, scale)
+            cr = cairo.Context(surface)
+            scene._apply_view(cr)
+            for layer in scene._layer_list[1:] + scene._layer_list[:1]:
+                if layer.count:
+                    scene._paint(cr, layer)
+            GLib.idle_add(self._finish_render, jobs, surface)
+
+    def _finish_render(self, jobs, surface):
+        if jobs is self._render_jobs:
+            self._frame_surface = surface
+            self._rendering = False
+            self._drawing_area.queue_draw()
+            if self._render_dirty:
+                self._render_dirty = False
+                self._request_render()
+        return False
+
+    def _apply_view(self, cr):
+        cr.scale(self._scale, self._scale)
+        cr.translate(-self._origin[0], -self._origin[1])
+
+    def _render_layer(self, widget, layer):
+        scale = widget.get_scale_factor()
+        width = widget.get_allocated_width()
+        height = widget.get_allocated_height()
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width * scale, height * scale)
+        surface.set_device_scale(scale, scale)
+        cr = cairo.Context(surface)
+        self._apply_view(cr)
+        self._paint(cr, layer)
+        return surface
+
+    def _paint(self, cr, layer):
+        scale = self._scale
+        clip = cr.clip_extents()
+        limit = self._lod_pixels / scale if scale < 1 else 0.0
+        store = self._store
+        loc = store.loc
+        columns = store.columns
+        painters = self._painters
+        kind, rows = None, []
+        for item_id in self._visible(layer, *clip, limit):
+            value = loc[item_id]
+            if value >> 32 != kind:
+                if rows:
+                    painters[kind](cr, columns[kind], rows)
+                kind, rows = value >> 32, []
+            rows.append(value & 0xffffffff)
+        if rows:
+            painters[kind](cr, columns[kind], rows)
+        if limit:
+            boxes = {}
+            for cell, grid in layer.sizes.items():
+                if cell < 2 * limit:
+                    size = cell
+                    while size * scale < self._proxy_pixels:
+                        size <<= 1
+                    self._paint_occupancy(cr, grid, size, boxes, clip)
+            self._fill_boxes(cr, boxes)
+
+    def _paint_occupancy(self, cr, grid, size, boxes, clip):
+        surface, bx, by, blocks = grid.memo(size, partial(self._occupancy, grid, size))
+        if surface is None:
+            x1, y1, x2, y2 = clip
+            for (x, y), color in blocks.items():
+                x, y = x * size, y * size
+                if x <= x2 and x + size >= x1 and y <= y2 and y + size >= y1:
+                    boxes.setdefault(color, []).append((x, y, x + size, y + size))
+            return
+        cr.save()
+        cr.translate(bx * size, by * size)
+        cr.scale(size, size)
+        cr.set_source_surface(surface, 0, 0)
+        cr.get_source().set_filter(cairo.FILTER_NEAREST)
+        cr.paint()
+        cr.restore()
+
+    def _occupancy(self, grid, size):
+        loc = self._store.loc
+        columns = self._store.columns
+        blocks = {}
+        for item_id in grid.keys():
+            value = loc[item_id]
+            cols = columns[value >> 32]
+            row = value & 0xffffffff
+            block = (math.floor(cols.bbox[row * 4] / size), math.floor(cols.bbox[row * 4 + 1] / size))
+            if block not in blocks:
+                color = self._proxy_color(cols, row)
+                if color is not None:
+                    blocks[block] = color
+        if not blocks:
+            return None, 0, 0, blocks
+        xs = [x for x, y in blocks]
+        ys = [y for x, y in blocks]
+        bx, by = min(xs), min(ys)
+        width, height = max(xs) - bx + 1, max(ys) - by + 1
+        if width * height > self._proxy_image_limit:
+            return None, bx, by, blocks
+        pixels = array('I', bytes(4 * width * height))
+        for (x, y), color in blocks.items():
+            pixels[(y - by) * width + x - bx] = 0xff000000 | color
+        surface = cairo.ImageSurface.create_for_data(pixels, cairo.FORMAT_ARGB32, width, height, width * 4)
+        return surface, bx, by, blocks
+
+    def _proxy_color(self, cols, row):
+        flags = cols.flags[row]
+        if cols.extra is not None and isinstance(cols.extra[row], dict):
+            fills = cols.extra[row].get('fills')
+            if fills is not None:
+                return fills[0]
+        if flags & _HAS_FILL:
+            return cols.fill[row]
+        if flags & _HAS_OUTLINE:
+            return cols.outline[row]
+        return None
+
+    def _fill_boxes(self, cr, boxes):
+        pixel = 1.0 / self._scale
+        for color, group in boxes.items():
+            for x1, y1, x2, y2 in group:
+                cr.rectangle(x1, y1, max(x2 - x1, pixel), max(y2 - y1, pixel))
+            cr.set_source_rgb(*_unpack_color(color))
+            cr.fill()
+
+    def _paint_shapes(self, cr, cols, rows, add_path, stroke_fill=False):
+        coords, flags, fills, outlines, widths = cols.coords, cols.flags, cols.fill, cols.outline, cols.width
+        style = None
+        for row in rows:
+            current = (flags[row], fills[row], outlines[row], widths[row])
+            if style is not None and (current != style or current[0] & _HAS_OUTLINE):
+                self._finish_path(cr, style, stroke_fill)
+            style = current
+            add_path(cr, coords, row * 4)
+        if style is not None:
+            self._finish_path(cr, style, stroke_fill)
+
+    def _finish_path(self, cr, style, stroke_fill=False):
+        flags, fill, outline, width = style
+        cr.set_line_width(width if flags & _HAS_WIDTH else 2.0)
+        if flags & _HAS_FILL:
+            cr.set_source_rgb(*_unpack_color(fill))
+            if stroke_fill:
+                cr.stroke_preserve()
+            else:
+                cr.fill_preserve()
+        if flags & _HAS_OUTLINE:
+            cr.set_source_rgb(*_unpack_color(outline))
+            cr.stroke()
+        cr.new_path()
+
+    def _paint_texts(self, cr, cols, rows):
+        coords, fills, extra = cols.coords, cols.fill, cols.extra
+        layouts = self._text_layouts
+        color = None
+        for row in rows:
+            text, font = extra[row]
+            layout, baseline, extents = layouts.get(text, font, self._text_width(cols, row))
+            if fills[row] != color:
+                color = fills[row]
+                cr.set_source_rgb(*_unpack_color(color))
+            cr.move_to(coords[2 * row], coords[2 * row + 1] - baseline)
+            PangoCairo.show_layout(cr, layout)
+
+    def _paint_polylines(self, cr, cols, rows):
+        clip = cr.clip_extents()
+        for row in rows:
+            if not cols.flags[row] & _HAS_FILL:
+                continue
+            payload = cols.extra[row]
+            coords = payload['coords']
+            last = None
+            for start, end, bbox in payload['chunks']:
+                if not _boxes_intersect(bbox, clip):
+                    continue
+                if start != last:
+                    cr.move_to(coords[2 * start], coords[2 * start + 1])
+                _exhaust(map(cr.line_to, coords[2 * start + 2:2 * end:2], coords[2 * start + 3:2 * end:2]))
+                last = end - 1
+            if last is not None:
+                cr.set_line_width(self._half_width(cols, row) * 2)
+                cr.set_source_rgb(*_unpack_color(cols.fill[row]))
+                cr.stroke()
+
+    def _paint_rectangle_batches(self, cr, cols, rows):
+        clip = cr.clip_extents()
+        for row in rows:
+            payload = cols.extra[row]
+            coords = payload['coords']
+            fills = payload['fills']
+            flags = cols.flags[row] | (_HAS_FILL if fills is not None else 0)
+            style = None
+            for start, end, bbox in payload['chunks']:
+                if not _boxes_intersect(bbox, clip):
+                    continue
+                current = (flags, cols.fill[row] if fills is None else fills[start],
+                           cols.outline[row], cols.width[row])
+                if style is not None and current != style:
+                    self._finish_path(cr, style)
+                style = current
+                _exhaust(map(cr.rectangle, coords[4 * start:4 * end:4], coords[4 * start + 1:4 * end:4],
+                             coords[4 * start + 2:4 * end:4], coords[4 * start + 3:4 * end:4]))
+            if style is not None:
+                self._finish_path(cr, style)
 
     def create_rectangle(self, x1, y1, x2, y2, **kwargs):
-        self._items.append({
-            'type': 'rectangle',
-            'x': x1, 'y': y1,
-            'width': x2 - x1, 'height': y2 - y1,
-            'fill': kwargs.get('fill'),
-            'outline': kwargs.get('outline')
-        })
-        self._drawing_area.queue_draw()
+        return self._add_item(_RECTANGLE, (x1, y1, x2, y2), None, kwargs)
 
     def create_oval(self, x1, y1, x2, y2, **kwargs):
-        self._items.append({
-            'type': 'oval',
-            'x': x1, 'y': y1,
-            'width': x2 - x1, 'height': y2 - y1,
-            'fill': kwargs.get('fill'),
-            'outline': kwargs.get('outline')
-        })
-        self._drawing_area.queue_draw()
+        return self._add_item(_OVAL, (x1, y1, x2, y2), None, kwargs)
 
     def create_line(self, x1, y1, x2, y2, **kwargs):
-        self._items.append({
-            'type': 'line',
-            'x1': x1, 'y1': y1,
-            'x2': x2, 'y2': y2,
-            'fill': kwargs.get('fill')
-        })
-        self._drawing_area.queue_draw()
+        return self._add_item(_LINE, (x1, y1, x2, y2), None, kwargs)
 
     def create_text(self, x, y, text, **kwargs):
-        self._items.append({
-            'type': 'text',
-            'x': x, 'y': y,
-            'text': text,
-            'font': kwargs.get('font', ('Arial', 12))
-        })
+        return self._add_item(_TEXT, (x, y), (text, kwargs.get('font', ('Arial', 12))),
+                              kwargs, fill=(0, 0, 0))
+
+    def create_polyline(self, points, **kwargs):
+        coords = _as_doubles(points)
+        if len(coords) % 2:
+            raise ValueError("Polyline points must be (x, y) pairs")
+        return self._add_item(_POLYLINE, (), {'coords': coords, 'chunks': []}, kwargs, fill=(0, 0, 0))
+
+    def create_rectangles(self, xywh, **kwargs):
+        coords = _as_doubles(xywh)
+        if len(coords) % 4:
+            raise ValueError("Rectangles must be given as (x, y, width, height) rows")
+        fills = kwargs.get('fills')
+        payload = {
+            'coords': coords,
+            'fills': None if fills is None else _as_packed_colors(fills, len(coords) // 4),
+            'chunks': []
+        }
+        return self._add_item(_RECTANGLES, (), payload, kwargs)
+
+    def delete(self, *args):
+        if 'all' in args:
+            for item_id in list(self._animations):
+                self._end_animation(item_id)
+            self._store.clear()
+            self._tags.clear()
+            self._current = None
+            self._layers = {}
+            self._layer_list = []
+            self._layer(None)
+            self._redraw()
+            return
+        for tag_or_id in args:
+            for item_id in self._find(tag_or_id):
+                self._remove_item(item_id)
+
+    def coords(self, tag_or_id, *coords):
+        found = self._find(tag_or_id)
+        if not found:
+            return []
+        if not coords:
+            kind, cols, row = self._row(found[0])
+            return list(self._item_coords(cols, row))
+        if len(coords) == 1:
+            coords = coords[0]
+        self._set_coords(found[0], coords)
+
+    def _set_coords(self, item_id, coords):
+        kind, cols, row = self._row(item_id)
+        current = self._item_coords(cols, row)
+        if not cols.arity:
+            coords = _as_doubles(coords)
+            payload = cols.extra[row]
+            stride = 2 if kind == _POLYLINE else 4
+            if len(coords) % stride or (payload.get('fills') is not None and len(coords) != len(current)):
+                raise ValueError(f"Wrong number of coordinates for {_ITEM_TYPES[kind]} item")
+            cols.own('extra')
+            cols.extra[row] = dict(payload, coords=coords)
+        elif len(coords) != cols.arity:
+            raise ValueError(f"Wrong number of coordinates for {_ITEM_TYPES[kind]} item")
+        else:
+            cols.own('coords')
+            cols.coords[row * cols.arity:(row + 1) * cols.arity] = array('d', coords)
+        self._reindex(item_id)
+
+    def move(self, tag_or_id, dx, dy):
+        for item_id in self._find(tag_or_id):
+            kind, cols, row = self._row(item_id)
+            arity = cols.arity
+            if arity:
+                cols.own('coords')
+                coords = cols.coords
+                for i in range(row * arity, (row + 1) * arity, 2):
+                    coords[i] += dx
+                    coords[i + 1] += dy
+            else:
+                payload = cols.extra[row]
+                coords = payload['coords'][:]
+                stride = 2 if kind == _POLYLINE else 4
+                coords[0::stride] = array('d', [x + dx for x in coords[0::stride]])
+                coords[1::stride] = array('d', [y + dy for y in coords[1::stride]])
+                cols.own('extra')
+                cols.extra[row] = dict(payload, coords=coords)
+            self._reindex(item_id)
+
+    def animate(self, tag_or_id, coords=None, duration=0.25, easing='ease', on_done=None):
+        easing = _EASINGS[easing] if isinstance(easing, str) else easing
+        found = self._find(tag_or_id)
+        group = [len(found), on_done]
+        for item_id in found:
+            kind, cols, row = self._row(item_id)
+            start = tuple(self._item_coords(cols, row))
+            end = start if coords is None else tuple(_as_doubles(coords))
+            if len(end) != len(start):
+                raise ValueError(f"Wrong number of coordinates for {_ITEM_TYPES[kind]} item")
+            self._end_animation(item_id)
+            self._animations[item_id] = [start, end, None, duration, easing, group]
+        if found and self._animation_frame is None:
+            self._animation_frame = self.on_frame(self._step_animations)
+
+    def cancel_animation(self, tag_or_id):
+        for item_id in self._find(tag_or_id):
+            self._end_animation(item_id)
+
+    def _end_animation(self, item_id):
+        animation = self._animations.pop(item_id, None)
+        if animation is not None:
+            self._finish_animation_group(animation[5])
+
+    def _finish_animation_group(self, group):
+        group[0] -= 1
+        if group[0] == 0 and group[1] is not None:
+            group[1]()
+
+    def _step_animations(self, frame_time):
+        self._animation_frame = None
+        finished = []
+        for item_id, animation in list(self._animations.items()):
+            if item_id not in self._store:
+                self._end_animation(item_id)
+                continue
+            start, end, began, duration, easing, group = animation
+            if began is None:
+                animation[2] = began = frame_time
+            t = 1.0 if duration <= 0 else min(1.0, (frame_time - began) / duration)
+            k = easing(t)
+            self._set_coords(item_id, [a + (b - a) * k for a, b in zip(start, end)])
+            if t >= 1.0:
+                del self._animations[item_id]
+                finished.append(group)
+        if self._animations:
+            self._animation_frame = self.on_frame(self._step_animations)
+        for group in finished:
+            self._finish_animation_group(group)
+        return False
+
+    def _item_options(self, item_id):
+        kind, cols, row = self._row(item_id)
+        flags = cols.flags[row]
+        options = {
+            'type': _ITEM_TYPES[kind],
+            'tags': self._store.tags.get(item_id, ()),
+            'layer': self._layer_list[cols.layer[row]].name,
+            'fill': _unpack_color(cols.fill[row]) if flags & _HAS_FILL else None
+        }
+        if 'outline' in _ITEM_OPTIONS[kind]:
+            options['outline'] = _unpack_color(cols.outline[row]) if flags & _HAS_OUTLINE else None
+        if 'width' in _ITEM_OPTIONS[kind]:
+            options['width'] = cols.width[row] if flags & _HAS_WIDTH else None
+        if kind == _TEXT:
+            options['text'], options['font'] = cols.extra[row]
+        elif kind == _RECTANGLES:
+            options['fills'] = cols.extra[row]['fills']
+        return options
+
+    def itemconfig(self, tag_or_id, **kwargs):
+        found = self._find(tag_or_id)
+        if not kwargs:
+            return self._item_options(found[0]) if found else {}
+        for item_id in found:
+            kind, cols, row = self._row(item_id)
+            restyled = False
+            for key, value in kwargs.items():
+                if key == 'tags':
+                    self._set_tags(item_id, value)
+                elif key == 'layer':
+                    self._set_layer(item_id, value)
+                elif key not in _ITEM_OPTIONS[kind]:
+                    print(f"Warning: Unknown item option '{key}'")
+                elif key in ('fill', 'outline', 'width'):
+                    flag = {'fill': _HAS_FILL, 'outline': _HAS_OUTLINE, 'width': _HAS_WIDTH}[key]
+                    if key == 'width':
+                        packed = value
+                    else:
+                        packed = _pack_color(value)
+                    cols.own(key, 'flags')
+                    getattr(cols, key)[row] = packed or 0
+                    restyled = key != 'width'
+                    if packed is None:
+                        cols.flags[row] &= ~flag
+                    else:
+                        cols.flags[row] |= flag
+                elif key == 'fills':
+                    count = len(cols.extra[row]['coords']) // 4
+                    fills = None if value is None else _as_packed_colors(value, count)
+                    cols.own('extra')
+                    cols.extra[row] = dict(cols.extra[row], fills=fills)
+                    restyled = True
+                elif key == 'text':
+                    cols.own('extra')
+                    cols.extra[row] = (value, cols.extra[row][1])
+                elif key == 'font':
+                    cols.own('extra')
+                    cols.extra[row] = (cols.extra[row][0], value)
+            self._reindex(item_id)
+            if restyled:
+                kind, cols, row = self._row(item_id)
+                self._layer_list[cols.layer[row]].restyle(self._item_box(cols, row))
+
+    itemconfigure = itemconfig
+
+    def type(self, tag_or_id):
+        found = self._find(tag_or_id)
+        return _ITEM_TYPES[self._store.locate(found[0])[0]] if found else None
+
+    def bbox(self, tag_or_id):
+        found = self._find(tag_or_id)
+        if not found:
+            return None
+        boxes = []
+        for item_id in found:
+            kind, cols, row = self._row(item_id)
+            boxes.append(self._item_box(cols, row))
+        return (math.floor(min(b[0] for b in boxes)), math.floor(min(b[1] for b in boxes)),
+                math.ceil(max(b[2] for b in boxes)), math.ceil(max(b[3] for b in boxes)))
+
+    def text_extents(self, text, font=('Arial', 12), width=None):
+        return self._text_layouts.extents(text, font, width)
+
+    def find_withtag(self, tag_or_id):
+        return sorted(self._find(tag_or_id))
+
+    def gettags(self, tag_or_id):
+        found = self._find(tag_or_id)
+        return self._store.tags.get(found[0], ()) if found else ()
+
+    def addtag_withtag(self, tag, tag_or_id):
+        for item_id in self._find(tag_or_id):
+            tags = self._store.tags.get(item_id, ())
+            if tag not in tags:
+                self._set_tags(item_id, tags + (tag,))
+
+    def dtag(self, tag_or_id, tag=None):
+        if tag is None:
+            tag = tag_or_id
+        for item_id in self._find(tag_or_id):
+            tags = self._store.tags.get(item_id, ())
+            if tag in tags:
+                self._set_tags(item_id, tuple(t for t in tags if t != tag))
+
+    def find_overlapping(self, x1, y1, x2, y2):
+        box = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        return tuple(sorted(item_id for item_id in self._candidates(*box)
+                            if self._item_overlaps(item_id, box)))
+
+    def find_enclosed(self, x1, y1, x2, y2):
+        box = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        found = []
+        for item_id in self._candidates(*box):
+            kind, cols, row = self._row(item_id)
+            bx1, by1, bx2, by2 = self._item_box(cols, row)
+            if box[0] < bx1 and bx2 < box[2] and box[1] < by1 and by2 < box[3]:
+                found.append(item_id)
+        return tuple(sorted(found))
+
+    def find_closest(self, x, y, halo=None):
+        if not self._store:
+            return ()
+        halo = halo or 0
+        radius = self._layers[None].index.cell
+        while True:
+            candidates = self._candidates(x - radius, y - radius, x + radius, y + radius)
+            covered = all(layer.index.covers(x - radius, y - radius, x + radius, y + radius)
+                          for layer in self._layer_list)
+            if candidates:
+                best_id, best = None, math.inf
+                for item_id in candidates:
+                    kind, cols, row = self._row(item_id)
+                    if _box_distance(self._item_box(cols, row), x, y) > best:
+                        continue
+                    distance = max(0.0, self._item_distance(item_id, x, y) - halo)
+                    if distance < best or (distance == best and item_id > best_id):
+                        best_id, best = item_id, distance
+                if best <= radius or covered:
+                    return (best_id,)
+                radius = best
+            elif covered:
+                return ()
+            else:
+                radius *= 2
+
+    def tag_bind(self, tag_or_id, sequence, func, add=None):
+        if not self._item_events_connected:
+            self._drawing_area.add_events(Gdk.EventMask.BUTTON_PRESS_MASK |
+                                          Gdk.EventMask.BUTTON_RELEASE_MASK |
+                                          Gdk.EventMask.POINTER_MOTION_MASK |
+                                          Gdk.EventMask.LEAVE_NOTIFY_MASK)
+            self._drawing_area.connect("button-press-event", self._on_item_button)
+            self._drawing_area.connect("button-release-event", self._on_item_button)
+            self._drawing_area.connect("motion-notify-event", self._on_item_motion)
+            self._drawing_area.connect("leave-notify-event", self._on_item_leave)
+            self._item_events_connected = True
+        handlers = self._item_bindings.setdefault(tag_or_id, {}).setdefault(sequence, [])
+        if not add:
+            handlers.clear()
+        handlers.append(func)
+        return func
+
+    def tag_unbind(self, tag_or_id, sequence, funcid=None):
+        handlers = self._item_bindings.get(tag_or_id, {}).get(sequence)
+        if handlers is None:
+            return
+        if funcid is None:
+            handlers.clear()
+        elif funcid in handlers:
+            handlers.remove(funcid)
+
+    def _dispatch_item_event(self, item_id, sequence, event):
+        if item_id not in self._store:
+            return
+        bindings = self._item_bindings
+        for key in (item_id,) + self._store.tags.get(item_id, ()) + ('all',):
+            for func in tuple(bindings.get(key, {}).get(sequence, ())):
+                func(event)
+
+    def _update_current(self, event):
+        item_id = self._item_at(self.canvasx(event.x), self.canvasy(event.y))
+        if item_id != self._current:
+            previous, self._current = self._current, item_id
+            if previous is not None:
+                self._dispatch_item_event(previous, "<Leave>", event)
+            if item_id is not None:
+                self._dispatch_item_event(item_id, "<Enter>", event)
+
+    def _on_item_button(self, widget, event):
+        self._update_current(event)
+        if self._current is not None:
+            if event.type == Gdk.EventType.BUTTON_PRESS:
+                sequence = f"<Button-{event.button}>"
+            elif event.type == Gdk.EventType.BUTTON_RELEASE:
+                sequence = f"<ButtonRelease-{event.button}>"
+            elif event.type == Gdk.EventType._2BUTTON_PRESS:
+                sequence = f"<Double-Button-{event.button}>"
+            else:
+                return False
+            self._dispatch_item_event(self._current, sequence, event)
+        return False
+
+    def _on_item_motion(self, widget, event):
+        self._update_current(event)
+        if self._current is not None:
+            self._dispatch_item_event(self._current, "<Motion>", event)
+        return False
+
+    def _on_item_leave(self, widget, event):
+        if self._current is not None:
+            previous, self._current = self._current, None
+            self._dispatch_item_event(previous, "<Leave>", event)
+        return False
+
+    def _set_scrollregion(self, region):
+        self._scrollregion = region
+
+    def _set_view(self, scale, x, y):
+        self._scale = scale
+        self._origin = (x, y)
+        for layer in self._layer_list:
+            layer.surface = None
+        self._redraw()
+
+    def _view_size(self):
+        return (self._drawing_area.get_allocated_width(), self._drawing_area.get_allocated_height())
+
+    def _scroll_bounds(self):
+        if self._scrollregion:
+            return tuple(float(v) for v in self._scrollregion)
+        boxes = [cols.bbox for cols in self._store.columns if len(cols.ids)]
+        if not boxes:
+            return (0.0, 0.0) + tuple(float(v) for v in self._view_size())
+        return (min(min(bbox[0::4]) for bbox in boxes), min(min(bbox[1::4]) for bbox in boxes),
+                max(max(bbox[2::4]) for bbox in boxes), max(max(bbox[3::4]) for bbox in boxes))
+
+    def _view(self, axis, *args):
+        bounds = self._scroll_bounds()
+        origin = list(self._origin)
+        extent = self._view_size()[axis] / self._scale
+        if not args:
+            low = min(bounds[axis], origin[axis])
+            high = max(bounds[axis + 2], origin[axis] + extent)
+            span = (high - low) or 1.0
+            first = (origin[axis] - low) / span
+            return (first, first + extent / span)
+        if args[0] == 'moveto':
+            origin[axis] = bounds[axis] + float(args[1]) * (bounds[axis + 2] - bounds[axis])
+        elif args[0] == 'scroll':
+            step = extent * 0.9 if args[2] == 'pages' else self._scroll_increment / self._scale
+            origin[axis] += int(args[1]) * step
+        else:
+            print(f"Warning: Unknown view command '{args[0]}'")
+            return
+        self._set_view(self._scale, *origin)
+
+    def xview(self, *args):
+        return self._view(0, *args)
+
+    def yview(self, *args):
+        return self._view(1, *args)
+
+    def xview_moveto(self, fraction):
+        self._view(0, 'moveto', fraction)
+
+    def yview_moveto(self, fraction):
+        self._view(1, 'moveto', fraction)
+
+    def xview_scroll(self, number, what):
+        self._view(0, 'scroll', number, what)
+
+    def yview_scroll(self, number, what):
+        self._view(1, 'scroll', number, what)
+
+    def canvasx(self, screenx, gridspacing=None):
+        x = self._origin[0] + screenx / self._scale
+        return round(x / gridspacing) * gridspacing if gridspacing else x
+
+    def canvasy(self, screeny, gridspacing=None):
+        y = self._origin[1] + screeny / self._scale
+        return round(y / gridspacing) * gridspacing if gridspacing else y
+
+    def scale(self, factor=None, x=None, y=None):
+        if factor is None:
+            return self._scale
+        width, height = self._view_size()
+        x = width / 2 if x is None else x
+        y = height / 2 if y is None else y
+        wx, wy = self.canvasx(x), self.canvasy(y)
+        self._set_view(factor, wx - x / factor, wy - y / factor)
+
+
+class _SeriesBuffer:
+    _block_sizes = (16, 256, 4096)
+
+    def __init__(self, capacity, color, width):
+        block = self._block_sizes[-1]
+        self.window = capacity
+        capacity = max(block, -(-capacity // block) * block)
+        self.capacity = capacity
+        self.color = color
+        self.width = width
+        self.values = array('d', bytes(8 * capacity))
+        self.mins = [array('d', bytes(8 * (capacity // size))) for size in self._block_sizes]
+        self.maxs = [array('d', bytes(8 * (capacity // size))) for size in self._block_sizes]
+        self.total = 0
+        self._column_width = None
+        self._columns = {}
+
+    def __len__(self):
+        return min(self.total, self.window)
+
+    def append(self, value):
+        n = self.total
+        capacity = self.capacity
+        self.values[n % capacity] = value
+        for size, mins, maxs in zip(self._block_sizes, self.mins, self.maxs):
+            slot = (n // size) % (capacity // size)
+            if n % size == 0:
+                mins[slot] = value
+                maxs[slot] = value
+            elif value < mins[slot]:
+                mins[slot] = value
+            elif value > maxs[slot]:
+                maxs[slot] = value
+        self.total = n + 1
+
+    def clear(self):
+        self.total = 0
+        self._columns = {}
+
+    def columns(self, width):
+        if width != self._column_width:
+            self._column_width = width
+            self._columns = {}
+        cache = self._columns
+        total = self.total
+        oldest = total - len(self)
+        per_column = self.window / width
+        current = int((total - 1) / per_column) if total else 0
+        first = current - width + 1
+        column = []
+        for bucket in range(first, current + 1):
+            value = cache.get(bucket)
+            if value is None:
+                start = int(bucket * per_column)
+                end = int((bucket + 1) * per_column)
+                if start >= oldest and end <= total:
+                    value = cache[bucket] = (math.inf, -math.inf) if start >= end else self.minmax(start, end)
+                else:
+                    start = max(start, oldest, 0)
+                    end = min(end, total)
+                    value = (math.inf, -math.inf) if start >= end else self.minmax(start, end)
+            elif int(bucket * per_column) < oldest:
+                del cache[bucket]
+                start = oldest
+                end = int((bucket + 1) * per_column)
+                value = (math.inf, -math.inf) if start >= end else self.minmax(start, end)
+            column.append(value)
+        if len(cache) > 2 * width:
+            self._columns = {bucket: value for bucket, value in cache.items() if bucket >= first}
+        return column
+
+    def minmax(self, start, end):
+        values = self.values
+        capacity = self.capacity
+        levels = tuple(zip(self._block_sizes, self.mins, self.maxs))[::-1]
+        low = math.inf
+        high = -math.inf
+        i = start
+        while i < end:
+            for size, mins, maxs in levels:
+                if i % size == 0 and i + size <= end:
+                    slot = (i // size) % (capacity // size)
+                    low = min(low, mins[slot])
+                    high = max(high, maxs[slot])
+                    i += size
+                    break
+            else:
+                value = values[i % capacity]
+                low = min(low, value)
+                high = max(high, value)
+                i += 1
+        return low, high
+
+
+class StripChart(Canvas):
+    def _create_widget(self, **kwargs):
+        self._series = {}
+        self._capacity = kwargs.get('capacity', 10000)
+        self._yrange = kwargs.get('yrange')
+        self._redraw_frame = None
+        return super()._create_widget(**kwargs)
+
+    def _set_capacity(self, capacity):
+        self._capacity = capacity
+        for name, series in self._series.items():
+            self._series[name] = _SeriesBuffer(capacity, series.color, series.width)
+        self._queue_redraw()
+
+    def _set_yrange(self, yrange):
+        self._yrange = yrange
+        self._queue_redraw()
+
+    def add_series(self, name, color='blue', width=1.0):
+        self._series[name] = _SeriesBuffer(self._capacity, _unpack_color(_pack_color(color)), width)
+
+    def append(self, name, value):
+        self._series[name].append(value)
+        self._queue_redraw()
+
+    def extend(self, name, values):
+        append = self._series[name].append
+        for value in values:
+            append(value)
+        self._queue_redraw()
+
+    def clear(self, name=None):
+        for series_name, series in self._series.items():
+            if name is None or series_name == name:
+                series.clear()
+        self._queue_redraw()
+
+    def _queue_redraw(self):
+        if self._redraw_frame is None:
+            self._redraw_frame = self.on_frame(self._on_redraw_frame)
+
+    def _on_redraw_frame(self, frame_time):
+        self._redraw_frame = None
         self._drawing_area.queue_draw()
+        return False
 
-    def delete(self, item_id):
-        if 0 <= item_id < len(self._items):
-            del self._items[item_id]
-            self._drawing_area.queue_draw()
+    def _on_draw(self, widget, cr):
+        super()._on_draw(widget, cr)
+        width = widget.get_allocated_width()
+        height = widget.get_allocated_height()
+        if width <= 0 or height <= 0:
+            return
+        columns = {name: series.columns(width) for name, series in self._series.items()}
+        if self._yrange is not None:
+            low, high = self._yrange
+        else:
+            lows = [low for column in columns.values() for low, high in column if low <= high]
+            highs = [high for column in columns.values() for low, high in column if low <= high]
+            if not lows:
+                return
+            low, high = min(lows), max(highs)
+        if high == low:
+            low, high = low - 1, high + 1
+        scale = (height - 1) / (high - low)
+        for name, column in columns.items():
+            series = self._series[name]
+            started = False
+            for x, (value_low, value_high) in enumerate(column):
+                if value_low > value_high:
+                    continue
+                y_high = height - 1 - (value_high - low) * scale
+                y_low = height - 1 - (value_low - low) * scale
+                if started:
+                    cr.line_to(x + 0.5, y_high)
+                else:
+                    cr.move_to(x + 0.5, y_high)
+                    started = True
+                cr.line_to(x + 0.5, y_low)
+            if started:
+                cr.set_line_width(series.width)
+                cr.set_source_rgb(*series.color)
+                cr.stroke()
 
 
 class PhotoImage:
@@ -1092,61 +3996,138 @@ class PhotoImage:
         return self.pixbuf.get_height()
 
 
-class StringVar:
-    def __init__(self, master=None, value=""):
-        self._value = value
-        self._trace_callbacks = []
+class Variable:
+    __slots__ = ('_name', '_value', '_traces', '_reads', '_coalesce', '_pending', '_writer', '_dispatching',
+                 '_redispatch')
+    _default = None
+    _serial = 0
+    _modes = {'r': 'read', 'w': 'write', 'u': 'unset'}
+
+    def __init__(self, master=None, value=None, name=None, coalesce=False):
+        Variable._serial += 1
+        self._name = name or f"PY_VAR{Variable._serial}"
+        self._value = self._default if value is None else value
+        self._traces = []
+        self._reads = False
+        self._coalesce = coalesce
+        self._pending = None
+        self._writer = None
+        self._dispatching = False
+        self._redispatch = False
+
+    def __str__(self):
+        return self._name
 
     def get(self):
+        if self._reads:
+            self._dispatch(None, 'read')
         return self._value
 
     def set(self, new_value):
-        if self._value != new_value:
-            self._value = new_value
-            for callback in self._trace_callbacks:
-                callback()
-
-    def trace(self, mode, callback):
-        self._trace_callbacks.append(callback)
-        return callback
-
+        self._set(new_value, None)
+
+    def _set(self, new_value, writer):
+        if self._value == new_value:
+            return
+        self._value = new_value
+        if not self._coalesce:
+            self._dispatch(writer)
+        elif self._pending is None:
+            self._writer = writer
+            self._pending = GLib.idle_add(self._notify)
+        elif self._writer != writer:
+            self._writer = None
+
+    def _notify(self):
+        writer = self._writer
+        self._pending = None
+        self._writer = None
+        self._dispatch(writer)
+        return False
+
+    def _dispatch(self, writer, mode='write'):
+        if self._dispatching:
+            if mode == 'write':
+                self._redispatch = True
+            return
+        self._dispatching = True
+        try:
+            while True:
+                self._redispatch = False
+                dead = False
+                for cbname, modes, ref, legacy in tuple(self._traces):
+                    if mode not in modes:
+                        continue
+                    callback = ref()
+                    if callback is None:
+                        dead = True
+                    elif callback != writer:
+                        if legacy:
+                            callback()
+                        else:
+                            callback(self._name, '', mode)
+                if dead:
+                    self._traces = [trace for trace in self._traces if trace[2]() is not None]
+                    self._reads = any('read' in trace[1] for trace in self._traces)
+                if not self._redispatch:
+                    break
+                writer = None
+        finally:
+            self._dispatching = False
+
+    def _add_trace(self, modes, callback, legacy):
+        if hasattr(callback, '__self__') and hasattr(callback, '__func__'):
+            ref = weakref.WeakMethod(callback)
+        else:
+            ref = lambda: callback
+        Variable._serial += 1
+        cbname = f"{self._name}_trace{Variable._serial}"
+        self._traces.append((cbname, modes, ref, legacy))
+        self._reads = self._reads or 'read' in modes
+        return cbname
+
+    def trace_add(self, mode, callback):
+        modes = (mode,) if isinstance(mode, str) else tuple(mode)
+        for name in modes:
+            if name not in ('read', 'write', 'unset', 'array'):
+                raise ValueError(f"Bad trace mode '{name}'")
+        return self._add_trace(modes, callback, False)
+
+    def trace_remove(self, mode, cbname):
+        removed = {self._modes.get(name, name) for name in ((mode,) if isinstance(mode, str) else mode)}
+        for position, (name, modes, ref, legacy) in enumerate(self._traces):
+            if name == cbname:
+                modes = tuple(name for name in modes if name not in removed)
+                if modes:
+                    self._traces[position] = (cbname, modes, ref, legacy)
+                else:
+                    del self._traces[position]
+                break
+        self._reads = any('read' in trace[1] for trace in self._traces)
 
-class IntVar:
-    def __init__(self, master=None, value=0):
-        self._value = value
-        self._trace_callbacks = []
+    def trace_info(self):
+        return [(modes, cbname) for cbname, modes, ref, legacy in self._traces if ref() is not None]
 
-    def get(self):
-        return self._value
+    def trace(self, mode, callback):
+        return self._add_trace(tuple(self._modes[name] for name in mode), callback, True)
 
-    def set(self, new_value):
-        if self._value != new_value:
-            self._value = new_value
-            for callback in self._trace_callbacks:
-                callback()
+    trace_variable = trace
+    trace_vdelete = trace_remove
 
-    def trace(self, mode, callback):
-        self._trace_callbacks.append(callback)
-        return callback
 
+class StringVar(Variable):
+    __slots__ = ()
+    _default = ""
 
-class BooleanVar:
-    def __init__(self, master=None, value=False):
-        self._value = value
-        self._trace_callbacks = []
 
-    def get(self):
-        return self._value
+class IntVar(Variable):
+    __slots__ = ()
+    _default = 0
 
-    def set(self, new_value):
-        if self._value != new_value:
-            self._value = new_value
-            for callback in self._trace_callbacks:
-                callback()
 
-    def trace(self, mode, callback):
-        self._trace_callbacks.append(callback)
-        return callback
+class BooleanVar(Variable):
+    __slots__ = ()
+    _default = False
 
 
 class Scale(Widget):
@@ -1294,43 +4275,320 @@ class Separator(Widget):
 class ProgressBar(Widget):
     def _create_widget(self, **kwargs):
         pb = Gtk.ProgressBar()
+        self._pulse_id = None
         pb.set_fraction(kwargs.get('value', 0) / 100.0)
         pb.set_show_text(kwargs.get('showtext', False))
         return pb
 
     def start(self, interval=50):
-        self._widget.pulse()
-        GLib.timeout_add(interval, self._widget.pulse)
+        if self._pulse_id is not None:
+            self.cancel_frame(self._pulse_id)
+        self._pulse_interval = interval / 1000.0
+        self._last_pulse = None
+        self._pulse_id = self.on_frame(self._pulse)
+
+    def _pulse(self, frame_time):
+        if self._last_pulse is None or frame_time - self._last_pulse >= self._pulse_interval:
+            self._last_pulse = frame_time
+            self._widget.pulse()
 
     def stop(self):
+        if self._pulse_id is not None:
+            self.cancel_frame(self._pulse_id)
+            self._pulse_id = None
         self._widget.set_fraction(0)
 
     def step(self, amount=1):
         self._widget.set_fraction(min(1.0, self._widget.get_fraction() + amount / 100.0))
 
 
+_PLACEHOLDER = object()
+_LOADING = object()
+
+
+def _compare_keys(model, a, b, column):
+    first, second = model.get_value(a, column), model.get_value(b, column)
+    if first is None or second is None:
+        return (first is not None) - (second is not None)
+    return (first > second) - (first < second)
+
+
 class TreeView(Widget):
-    def _create_widget(self, **kwargs):
-        self._liststore = Gtk.ListStore(*([str] * kwargs.get('columns', 1)))
-        treeview = Gtk.TreeView(model=self._liststore)
+    _create_options = ('columns', 'types', 'rows', 'count', 'loader', 'background', 'tree',
+                       'filter', 'sort_keys', 'sortable')
+    _row_cache_size = 4096
+    _resize_threshold = 64
+    _placeholder_text = "Loading..."
+    _column_types = {'str': str, 'int': int, 'float': float, 'bool': bool, 'pixbuf': GdkPixbuf.Pixbuf}
+    _column_gtypes = {str: str, int: GObject.TYPE_INT64, float: float, bool: bool}
+    _column_defaults = {str: '', int: 0, float: 0.0, bool: False}
 
-        for i in range(kwargs.get('columns', 1)):
-            renderer = Gtk.CellRendererText()
-            column = Gtk.TreeViewColumn(f"Column {i + 1}", renderer, text=i)
+    def _create_widget(self, **kwargs):
+        types = kwargs.get('types') or [str] * kwargs.get('columns', 1)
+        self._types = [self._column_types.get(t, t) for t in types]
+        self._columns = len(self._types)
+        self._loader = kwargs.get('loader')
+        self._background = kwargs.get('background', False)
+        self._tree = bool(kwargs.get('tree')) or self._loader is not None
+        self._filter = kwargs.get('filter')
+        self._sort_keys = {}
+        self._sort_types = {}
+        for index, key in dict(kwargs.get('sort_keys') or {}).items():
+            key_type = object
+            if isinstance(key, tuple):
+                key, key_type = key
+            self._sort_keys[index] = key
+            self._sort_types[index] = self._column_types.get(key_type, key_type)
+        self._sortable = bool(kwargs.get('sortable')) or bool(self._sort_keys)
+
+        gtypes = [self._column_gtypes.get(t, t) for t in self._types]
+        self._gtypes = gtypes[:]
+        hidden = len(gtypes)
+        if self._tree:
+            gtypes.append(object)
+        self._visible_column = len(gtypes)
+        gtypes.append(bool)
+        self._sort_columns = {}
+        for index in sorted(self._sort_keys):
+            self._sort_columns[index] = len(gtypes)
+            key_type = self._sort_types[index]
+            gtypes.append(self._column_gtypes.get(key_type, key_type))
+        self._key_column = hidden if self._tree else None
+        if self._tree:
+            self._store = Gtk.TreeStore(*gtypes)
+        else:
+            self._store = Gtk.ListStore(*gtypes)
+        treeview = Gtk.TreeView()
+
+        for i, column_type in enumerate(self._types):
+            if column_type is bool:
+                renderer = Gtk.CellRendererToggle()
+                column = Gtk.TreeViewColumn(f"Column {i + 1}", renderer, active=i)
+            elif column_type is GdkPixbuf.Pixbuf:
+                renderer = Gtk.CellRendererPixbuf()
+                column = Gtk.TreeViewColumn(f"Column {i + 1}", renderer, pixbuf=i)
+            else:
+                renderer = Gtk.CellRendererText()
+                column = Gtk.TreeViewColumn(f"Column {i + 1}", renderer, text=i)
+            if self._sortable and column_type is not GdkPixbuf.Pixbuf:
+                column.set_sort_column_id(self._sort_columns.get(i, i))
             treeview.append_column(column)
 
+        self._treeview = treeview
+        self._view_model = self._build_view_model()
+        treeview.set_model(self._view_model)
         self._widget = Gtk.ScrolledWindow()
         self._widget.add(treeview)
+        self._virtual = None
+        if kwargs.get('rows') is not None:
+            self.set_rows(kwargs['rows'], kwargs.get('count'))
+        if self._loader is not None:
+            treeview.connect("test-expand-row", self._on_test_expand_row)
+            self._load_children(None, None)
         return self._widget
 
+    def _build_view_model(self):
+        model = self._store
+        if self._filter is not None:
+            model = self._store.filter_new(None)
+            model.set_visible_column(self._visible_column)
+        if self._sortable:
+            model = Gtk.TreeModelSort(model=model)
+            for index, column in self._sort_columns.items():
+                if self._sort_types[index] is object:
+                    model.set_sort_func(column, _compare_keys, column)
+        return model
+
+    def set_rows(self, rows, count=None):
+        model = None if rows is None else _VirtualRows(rows, count, self._gtypes, self._typed_row,
+                                                       self._row_cache_size)
+        self._virtual = _set_virtual_rows(self._treeview, model, self._view_model)
+
+    def refresh(self, count=None):
+        if self._virtual is not None:
+            self._virtual = _refresh_virtual_rows(self._treeview, self._virtual, count, self._view_model,
+                                                  self._resize_threshold)
+
+    def _check_editable(self):
+        if self._virtual is not None:
+            raise ValueError("TreeView shows virtual rows; edit the row source and call refresh()")
+
+    def set_filter(self, func):
+        chained = self._filter is not None
+        self._filter = func
+        store = self._store
+        visible = self._visible_column
+        key_column = self._key_column
+        columns = self._columns
+        self._treeview.set_model(None)
+
+        def update(model, path, treeiter):
+            if key_column is not None:
+                marker = store.get_value(treeiter, key_column)
+                if marker is _PLACEHOLDER or marker is _LOADING:
+                    return False
+            values = tuple(store.get_value(treeiter, i) for i in range(columns))
+            store.set_value(treeiter, visible, func is None or bool(func(values)))
+            return False
+
+        store.foreach(update)
+        if chained != (func is not None):
+            previous = self._view_model
+            self._view_model = self._build_view_model()
+            if self._sortable:
+                sort_column, order = previous.get_sort_column_id()
+                if sort_column is not None:
+                    self._view_model.set_sort_column_id(sort_column, order)
+        if self._virtual is None:
+            self._treeview.set_model(self._view_model)
+        else:
+            self._treeview.set_model(self._virtual)
+
+    def _convert(self, value, column_type):
+        if column_type in self._column_defaults:
+            return self._column_defaults[column_type] if value is None else column_type(value)
+        return value
+
+    def _typed_row(self, values):
+        types = self._types
+        row = [self._convert(value, column_type) for value, column_type in zip(values, types)]
+        row.extend(self._column_defaults.get(column_type) for column_type in types[len(row):])
+        return row
+
+    def _row_values(self, values, key):
+        if not isinstance(values, (tuple, list)):
+            values = (values,)
+        row = self._typed_row(values)
+        visible = self._filter is None or bool(self._filter(tuple(row)))
+        keys = [self._convert(self._sort_keys[index](row[index]), self._sort_types[index])
+                for index in self._sort_columns]
+        return row + ([key] if self._tree else []) + [visible] + keys
+
+    def _placeholder_row(self):
+        types = self._types
+        row = [self._column_defaults.get(column_type) for column_type in types]
+        if types[0] is str:
+            row[0] = self._placeholder_text
+        keys = [self._column_defaults.get(self._sort_types[index]) for index in self._sort_columns]
+        return row + [_PLACEHOLDER, True] + keys
+
+    def _on_test_expand_row(self, treeview, treeiter, path):
+        store = self._store
+        model = treeview.get_model()
+        while model is not store:
+            treeiter = model.convert_iter_to_child_iter(treeiter)
+            model = model.get_model()
+        child = store.iter_children(treeiter)
+        if child is not None and store.get_value(child, self._key_column) is _PLACEHOLDER:
+            store.set_value(child, self._key_column, _LOADING)
+            return not self._load_children(treeiter, store.get_value(treeiter, self._key_column))
+        return False
+
+    def _load_children(self, parent, key):
+        if not self._background:
+            try:
+                children = list(self._loader(key))
+            except Exception as error:
+                self._fail_load(parent, error)
+                return False
+            self._fill_children(parent, children)
+            return True
+        reference = None if parent is None else Gtk.TreeRowReference.new(self._store, self._store.get_path(parent))
+        threading.Thread(target=self._load_in_background, args=(reference, key), daemon=True).start()
+        return True
+
+    def _load_in_background(self, reference, key):
+        try:
+            children = list(self._loader(key))
+        except Exception as error:
+            GLib.idle_add(self._finish_failed_load, reference, error)
+            return
+        GLib.idle_add(self._finish_load, reference, children)
+
+    def _finish_failed_load(self, reference, error):
+        if reference is None:
+            self._fail_load(None, error)
+        elif reference.valid():
+            self._fail_load(self._store.get_iter(reference.get_path()), error)
+        return False
+
+    def _fail_load(self, parent, error):
+        store = self._store
+        child = None if parent is None else store.iter_children(parent)
+        if child is not None and store.get_value(child, self._key_column) is _LOADING:
+            store.set_value(child, self._key_column, _PLACEHOLDER)
+            path = self._view_path(store.get_path(parent))
+            if path is not None:
+                self._treeview.collapse_row(path)
+        sys.excepthook(type(error), error, error.__traceback__)
+
+    def _view_path(self, path):
+        models = []
+        model = self._treeview.get_model()
+        while model is not self._store:
+            if model is None or model is self._virtual:
+                return None
+            models.append(model)
+            model = model.get_model()
+        for model in reversed(models):
+            path = model.convert_child_path_to_path(path)
+            if path is None:
+                return None
+        return path
+
+    def _finish_load(self, reference, children):
+        if reference is None:
+            self._fill_children(None, children)
+        elif reference.valid():
+            self._fill_children(self._store.get_iter(reference.get_path()), children)
+        return False
+
+    def _fill_children(self, parent, children):
+        store = self._store
+        placeholder = store.iter_children(parent)
+        if placeholder is not None:
+            marker = store.get_value(placeholder, self._key_column)
+            if marker is not _PLACEHOLDER and marker is not _LOADING:
+                placeholder = None
+        append = store.append
+        loading = self._placeholder_row()
+        for key, values, *expandable in children:
+            child = append(parent, self._row_values(values, key))
+            if not expandable or expandable[0]:
+                append(child, loading)
+        if placeholder is not None:
+            store.remove(placeholder)
+
     def insert(self, parent, index, *values):
-        return self._liststore.insert(parent, index, list(values))
+        self._check_editable()
+        if self._tree:
+            return self._store.insert(parent, index, self._row_values(values, None))
+        return self._store.insert(index, self._row_values(values, None))
+
+    def _append_rows(self, rows):
+        self._check_editable()
+        store = self._store
+        row_values = self._row_values
+        if self._tree:
+            for values in rows:
+                store.append(None, row_values(values, None))
+        else:
+            for values in rows:
+                store.append(row_values(values, None))
+
+    def stream(self, iterable, chunk=500, budget_ms=8, on_progress=None, on_done=None, on_error=None, loop=None):
+        self._check_editable()
+        return _RowStream(self._append_rows, iterable, chunk, budget_ms, on_progress, on_done, on_error, loop)
 
     def delete(self, iter):
-        self._liststore.remove(iter)
+        self._check_editable()
+        self._store.remove(iter)
 
     def get_children(self, iter=None):
-        return self._liststore.iter_children(iter)
+        return self._store.iter_children(iter)
+
+    def get_key(self, iter):
+        return self._store.get_value(iter, self._key_column) if self._tree else None
 
 
 class MessageDialog:
@@ -1499,16 +4757,15 @@ def config(widget, **kwargs):
 
 
 class Combobox(Widget):
+    _create_options = ('textvariable',)
+
     def _create_widget(self, **kwargs):
         self._liststore = Gtk.ListStore(str)
         self._combobox = Gtk.ComboBox.new_with_model(self._liststore)
         renderer = Gtk.CellRendererText()
         self._combobox.pack_start(renderer, True)
         self._combobox.add_attribute(renderer, "text", 0)
-
-        if 'values' in kwargs:
-            for value in kwargs['values']:
-                self._liststore.append([str(value)])
+        self._lookup = _ValueIndex()
 
         if 'textvariable' in kwargs:
             self._textvariable = kwargs['textvariable']
@@ -1528,12 +4785,28 @@ class Combobox(Widget):
             return self._liststore[active][0]
         return None
 
+    def _set_values(self, values):
+        self._lookup.reset(values)
+        self._combobox.set_model(None)
+        self._liststore.clear()
+        append = self._liststore.insert_with_valuesv
+        for value in self._lookup.values:
+            append(-1, [0], [value])
+        self._combobox.set_model(self._liststore)
+
     def set(self, value):
-        for i, row in enumerate(self._liststore):
-            if row[0] == str(value):
-                self._combobox.set_active(i)
-                return
-        self._combobox.set_active(-1)
+        row = self._lookup.row(value)
+        self._combobox.set_active(-1 if row is None else row)
+
+    def find(self, value):
+        return self._lookup.row(value)
+
+    def complete(self, prefix, limit=None):
+        return self._lookup.prefix(prefix, limit)
+
+    def select_value(self, value):
+        self.set(value)
+        return self._combobox.get_active() >= 0
 
 
 class Paned(Widget):
@@ -0,0 +1,103 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+gtkinter = pytest.importorskip("gtkinter")
+
+
+def make_canvas():
+    canvas = gtkinter.Canvas.__new__(gtkinter.Canvas)
+    canvas._init_items()
+    canvas._scale = 1.0
+    canvas._origin = (0.0, 0.0)
+    canvas._damage = lambda bbox: None
+    return canvas
+
+
+def test_find_closest_single_far_item():
+    canvas = make_canvas()
+    item = canvas.create_rectangle(1000, 1000, 1010, 1010)
+    assert canvas.find_closest(0, 0) == (item,)
+
+
+def test_find_closest_between_distant_items():
+    canvas = make_canvas()
+    near = canvas.create_rectangle(0, 0, 10, 10)
+    canvas.create_rectangle(2000, 2000, 2010, 2010)
+    assert canvas.find_closest(300, 300) == (near,)
+
+
+def test_find_closest_across_layers():
+    canvas = make_canvas()
+    canvas.create_rectangle(0, 0, 10, 10)
+    far = canvas.create_rectangle(5000, 5000, 5010, 5010, layer='static')
+    assert canvas.find_closest(4900, 4900) == (far,)
+
+
+def test_find_closest_empty():
+    assert make_canvas().find_closest(0, 0) == ()
+
+
+def test_grid_covers_tracks_occupied_bounds():
+    grid = gtkinter._SpatialGrid(cell=10)
+    assert grid.covers(0, 0, 0, 0)
+    grid.insert(1, (100, 100, 105, 105))
+    assert not grid.covers(0, 0, 50, 50)
+    assert grid.covers(0, 0, 110, 110)
+    grid.insert(2, (-50, -50, -45, -45))
+    assert not grid.covers(0, 0, 110, 110)
+    grid.remove(2, (-50, -50, -45, -45))
+    assert grid.covers(0, 0, 110, 110)
+
+
+def test_strip_chart_redraw_does_not_shadow_canvas_redraw():
+    assert gtkinter.StripChart._redraw is gtkinter.Canvas._redraw
+
+
+def test_snapshot_is_isolated_from_later_edits():
+    canvas = make_canvas()
+    moved = canvas.create_rectangle(0, 0, 10, 10)
+    removed = canvas.create_polyline([0, 0, 50, 50])
+    scene = canvas._snapshot()
+    canvas.move(moved, 500, 500)
+    canvas.move(removed, 5, 5)
+    canvas.delete(removed)
+    canvas.create_rectangle(900, 900, 910, 910)
+    kind, row = scene._store.locate(moved)
+    assert list(scene._store.columns[kind].coords[row * 4:row * 4 + 4]) == [0, 0, 10, 10]
+    assert removed in scene._store
+    layer = scene._layers[None]
+    assert layer.count == 2
+    assert set(layer.index.query(0, 0, 20, 20)) == {moved, removed}
+
+
+def test_layer_size_grids_follow_moves():
+    layer = gtkinter._CanvasLayer(None, 0, False)
+    layer.add(1, (0, 0, 3, 3))
+    layer.add(2, (0, 0, 100, 100))
+    assert layer.sizes[4].keys() == {1}
+    assert layer.sizes[128].keys() == {2}
+    layer.move(1, (0, 0, 3, 3), (50, 50, 90, 90))
+    assert 4 not in layer.sizes
+    assert layer.sizes[64].keys() == {1}
+    layer.remove(2, (0, 0, 100, 100))
+    assert set(layer.sizes) == {64}
+
+
+def test_zoomed_out_paint_draws_small_items_as_proxy_blocks():
+    cairo = pytest.importorskip("cairo")
+    canvas = make_canvas()
+    canvas._painters = canvas._make_painters()
+    for i in range(50):
+        canvas.create_rectangle(i * 200, 0, i * 200 + 10, 10, fill=(1, 0, 0))
+    canvas._scale = 0.05
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 100, 100)
+    cr = cairo.Context(surface)
+    canvas._apply_view(cr)
+    canvas._paint(cr, canvas._layers[None])
+    assert 128 in canvas._layers[None].sizes[16]._memos
+    surface.flush()
+    assert bytes(surface.get_data()[:4]) in (b'\x00\x00\xff\xff', b'\xff\xff\x00\x00')
@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+gtkinter = pytest.importorskip("gtkinter")
+
+CONTENT = "hello world\nsecond line\nthird"
+
+
+def make_text(content=CONTENT):
+    text = gtkinter.Text.__new__(gtkinter.Text)
+    text._buffer = gtkinter.Gtk.TextBuffer()
+    text._buffer.set_text(content)
+    text._marks = {}
+    return text
+
+
+@pytest.mark.parametrize("index, parsed", [
+    ("1.0", ((0, 0), ())),
+    ("3.end", ((2, None), ())),
+    ("end", ("end", ())),
+    ("end-1c", ("end", (("chars", -1),))),
+    ("1.0 + 5 chars", ((0, 0), (("chars", 5),))),
+    ("2.4 linestart", ((1, 4), (("linestart", 0),))),
+    ("2.4 lineend", ((1, 4), (("lineend", 0),))),
+    ("1.2+1 lines -2c", ((0, 2), (("lines", 1), ("chars", -2)))),
+    ("mymark+3l", ("mymark", (("lines", 3),))),
+])
+def test_parse_text_index(index, parsed):
+    assert gtkinter._parse_text_index(index) == parsed
+
+
+@pytest.mark.parametrize("index", ["", "1.0 +", "1.0 foo", "+3c", "1.0 + 2 words"])
+def test_parse_text_index_rejects_bad_input(index):
+    with pytest.raises(ValueError):
+        gtkinter._parse_text_index(index)
+
+
+@pytest.mark.parametrize("index, expected", [
+    ("1.0", "1.0"),
+    ("1.end", "1.11"),
+    ("2.3", "2.3"),
+    ("2.99", "2.11"),
+    ("9.0", "3.5"),
+    ("end", "3.5"),
+    ("end-1c", "3.5"),
+    ("end-2c", "3.4"),
+    ("1.0+5c", "1.5"),
+    ("1.0 + 5 chars", "1.5"),
+    ("2.4 linestart", "2.0"),
+    ("2.4 lineend", "2.11"),
+    ("1.2+1 lines", "2.2"),
+    ("3.4-2l", "1.4"),
+    ("end-1c linestart", "3.0"),
+    (1.0, "1.0"),
+    (2.3, "2.3"),
+])
+def test_text_iter_resolves_index(index, expected):
+    text = make_text()
+    assert gtkinter._text_index(text._iter(index)) == expected
+
+
+def test_text_iter_rejects_unknown_mark():
+    with pytest.raises(ValueError):
+        make_text()._iter("nosuchmark")
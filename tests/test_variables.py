@@ -0,0 +1,161 @@
+import gc
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+gtkinter = pytest.importorskip("gtkinter")
+
+
+class Listener:
+    def __init__(self, var):
+        self.var = var
+        self.seen = []
+
+    def changed(self, *args):
+        self.seen.append(self.var.get())
+
+
+@pytest.fixture
+def idle(monkeypatch):
+    queued = []
+    monkeypatch.setattr(gtkinter.GLib, "idle_add", lambda func, *args: queued.append((func, args)) or len(queued))
+    return queued
+
+
+def run_idle(queued):
+    while queued:
+        func, args = queued.pop(0)
+        func(*args)
+
+
+def test_set_skips_the_writer():
+    var = gtkinter.StringVar()
+    writer, other = Listener(var), Listener(var)
+    var.trace_add('write', writer.changed)
+    var.trace_add('write', other.changed)
+    var._set('typed', writer.changed)
+    assert writer.seen == []
+    assert other.seen == ['typed']
+
+
+def test_set_to_same_value_does_not_notify():
+    var = gtkinter.IntVar(value=3)
+    listener = Listener(var)
+    var.trace_add('write', listener.changed)
+    var.set(3)
+    assert listener.seen == []
+
+
+def test_set_from_a_trace_redispatches_once_with_the_final_value():
+    var = gtkinter.IntVar()
+    seen = []
+
+    def clamp(*args):
+        seen.append(('clamp', var.get()))
+        if var.get() > 10:
+            var.set(10)
+
+    var.trace_add('write', clamp)
+    var.trace_add('write', lambda *args: seen.append(('view', var.get())))
+    var.set(50)
+    assert var.get() == 10
+    assert seen == [('clamp', 50), ('view', 10), ('clamp', 10), ('view', 10)]
+
+
+def test_coalesced_burst_notifies_once_with_the_final_value(idle):
+    var = gtkinter.IntVar(coalesce=True)
+    listener = Listener(var)
+    var.trace_add('write', listener.changed)
+    for value in range(1, 101):
+        var.set(value)
+    assert listener.seen == []
+    assert len(idle) == 1
+    run_idle(idle)
+    assert listener.seen == [100]
+
+
+def test_coalesced_burst_skips_the_writer_only_if_it_made_every_change(idle):
+    var = gtkinter.StringVar(coalesce=True)
+    writer, other = Listener(var), Listener(var)
+    var.trace_add('write', writer.changed)
+    var.trace_add('write', other.changed)
+    var._set('a', writer.changed)
+    var._set('ab', writer.changed)
+    run_idle(idle)
+    assert writer.seen == []
+    assert other.seen == ['ab']
+    var._set('abc', writer.changed)
+    var.set('reset')
+    run_idle(idle)
+    assert writer.seen == ['reset']
+
+
+def test_trace_add_passes_name_index_and_mode():
+    var = gtkinter.StringVar(name='entry')
+    calls = []
+    var.trace_add(('read', 'write'), lambda *args: calls.append(args))
+    var.set('x')
+    var.get()
+    assert calls == [('entry', '', 'write'), ('entry', '', 'read')]
+
+
+def test_trace_add_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        gtkinter.StringVar().trace_add('change', print)
+
+
+def test_trace_info_and_trace_remove():
+    var = gtkinter.StringVar()
+    calls = []
+    first = var.trace_add(('read', 'write'), lambda *args: calls.append('first'))
+    second = var.trace_add('write', lambda *args: calls.append('second'))
+    assert var.trace_info() == [(('read', 'write'), first), (('write',), second)]
+    var.trace_remove('read', first)
+    assert var.trace_info() == [(('write',), first), (('write',), second)]
+    var.get()
+    assert calls == []
+    var.trace_remove('write', second)
+    var.set('x')
+    assert calls == ['first']
+    assert var.trace_info() == [(('write',), first)]
+
+
+def test_trace_vdelete_removes_legacy_trace():
+    var = gtkinter.StringVar()
+    calls = []
+    cbname = var.trace('w', lambda: calls.append(var.get()))
+    var.set('a')
+    var.trace_vdelete('w', cbname)
+    var.set('b')
+    assert calls == ['a']
+    assert var.trace_info() == []
+
+
+def test_dead_bound_method_trace_is_pruned():
+    var = gtkinter.StringVar()
+    keeper = Listener(var)
+    owner = Listener(var)
+    var.trace_add('write', keeper.changed)
+    var.trace_add('write', owner.changed)
+    del owner
+    gc.collect()
+    assert len(var.trace_info()) == 1
+    var.set('x')
+    assert len(var._traces) == 1
+    assert keeper.seen == ['x']
+
+
+def test_plain_function_trace_is_held_strongly():
+    var = gtkinter.StringVar()
+    calls = []
+
+    def make():
+        return lambda *args: calls.append(var.get())
+
+    var.trace_add('write', make())
+    gc.collect()
+    var.set('x')
+    assert calls == ['x']